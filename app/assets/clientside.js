@@ -0,0 +1,455 @@
+// Client-side filtering mode, see app/clientside.py
+//
+// dashboard.update draws the metrics and every chart from the aggregates in
+// the client-aggregates store, mirroring the figures of callbacks.py.
+(function () {
+    var FONT = 'Montserrat, sans-serif';
+    var N_RATING_BUCKETS = 41;
+    var PLATFORM_COLORS = {
+        'Netflix': '#E50914',
+        'Hulu': '#1CE783',
+        'Prime Video': '#00A8E1',
+        'Disney+': '#113CCF'
+    };
+    var COMPARISON_COLORS = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12'];
+    var MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'];
+
+    // Rating slider ranges on the 0.5 grid map exactly onto buckets 4 * low .. 4 * high
+    function bucketRange(ratingRange) {
+        return [
+            Math.max(0, Math.ceil(ratingRange[0] * 4 - 1e-9)),
+            Math.min(N_RATING_BUCKETS - 1, Math.floor(ratingRange[1] * 4 + 1e-9))
+        ];
+    }
+
+    function platformBits(platforms, selected) {
+        var bits = 0;
+        selected.forEach(function (platform) { bits |= 1 << platforms.indexOf(platform); });
+        return bits;
+    }
+
+    // Positions of the table entries on any platform in bits inside the slider ranges
+    function selectRows(table, bits, yearRange, buckets) {
+        var rows = [];
+        for (var i = 0; i < table.mask.length; i++) {
+            if ((table.mask[i] & bits) !== 0 &&
+                    table.year[i] >= yearRange[0] && table.year[i] <= yearRange[1] &&
+                    table.bucket[i] >= buckets[0] && table.bucket[i] <= buckets[1]) {
+                rows.push(i);
+            }
+        }
+        return rows;
+    }
+
+    // [[value, count], ...] of a tally, largest first, ties in order of first appearance
+    function valueCounts(tally, rows) {
+        var totals = new Map();
+        rows.forEach(function (i) {
+            var value = tally.values[tally.value[i]];
+            totals.set(value, (totals.get(value) || 0) + tally.count[i]);
+        });
+        return Array.from(totals.entries()).sort(function (a, b) { return b[1] - a[1]; });
+    }
+
+    function message(text, template) {
+        return {
+            data: [],
+            layout: {
+                template: template,
+                annotations: [{
+                    text: text, xref: 'paper', yref: 'paper',
+                    x: 0.5, y: 0.5, xanchor: 'center', yanchor: 'middle',
+                    font: {size: 16, color: '#6c757d', family: FONT},
+                    showarrow: false
+                }]
+            }
+        };
+    }
+
+    function gridAxis() {
+        return {showgrid: true, gridcolor: 'rgba(0,0,0,0.1)'};
+    }
+
+    function metricCard(value, label, color, background) {
+        return {
+            namespace: 'dash_html_components', type: 'Div',
+            props: {
+                children: [
+                    {namespace: 'dash_html_components', type: 'Div', props: {children: value, style: {
+                        fontSize: '28px', fontWeight: '700', color: color, fontFamily: FONT, lineHeight: '1.2'
+                    }}},
+                    {namespace: 'dash_html_components', type: 'Div', props: {children: label, style: {
+                        fontSize: '12px', color: '#6c757d', marginTop: 6, fontFamily: FONT,
+                        fontWeight: '500', textTransform: 'uppercase', letterSpacing: '0.5px'
+                    }}}
+                ],
+                style: {
+                    textAlign: 'center', padding: '20px 16px', backgroundColor: background, border: 'none',
+                    borderLeft: '4px solid ' + color, borderRadius: '12px', marginBottom: 12,
+                    boxShadow: '0 2px 8px rgba(0,0,0,0.06)', transition: 'all 0.3s ease'
+                }
+            }
+        };
+    }
+
+    function metrics(data, selected, bits, yearRange, buckets) {
+        if (!selected.length) {
+            return [0, 1, 2].map(function () { return metricCard('--', 'Select Platforms', '#6c757d', '#f8f9fa'); });
+        }
+        var cells = data.cells;
+        var titles = 0, ratingSum = 0;
+        selectRows(cells, bits, yearRange, buckets).forEach(function (i) {
+            titles += cells.count[i];
+            ratingSum += cells.rating_sum[i];
+        });
+        var countries = valueCounts(data.countries, selectRows(data.countries, bits, yearRange, buckets)).length;
+        var average = titles > 0 ? ratingSum / titles : 0;
+        return [
+            metricCard(titles.toLocaleString('en-US'), 'Total Titles', '#3498db', '#ffffff'),
+            metricCard(average.toFixed(1) + '/10', 'Avg Rating', '#e74c3c', '#ffffff'),
+            metricCard(String(countries), 'Countries', '#2ecc71', '#ffffff')
+        ];
+    }
+
+    // Per selected platform: {year: count} and [count per month, 0 being unknown]
+    function platformCounts(data, selected, yearRange, buckets) {
+        var cells = data.cells;
+        return selected.map(function (platform) {
+            var bit = platformBits(data.platforms, [platform]);
+            var byYear = {}, byMonth = new Array(13).fill(0), histogram = new Array(N_RATING_BUCKETS).fill(0);
+            var titles = 0, votes = 0, ratingSum = 0;
+            selectRows(cells, bit, yearRange, [0, N_RATING_BUCKETS - 1]).forEach(function (i) {
+                histogram[cells.bucket[i]] += cells.count[i];
+                if (cells.bucket[i] < buckets[0] || cells.bucket[i] > buckets[1]) {
+                    return;
+                }
+                byYear[cells.year[i]] = (byYear[cells.year[i]] || 0) + cells.count[i];
+                byMonth[cells.month[i]] += cells.count[i];
+                titles += cells.count[i];
+                votes += cells.votes[i];
+                ratingSum += cells.rating_sum[i];
+            });
+            histogram = histogram.map(function (count, bucket) {
+                return bucket >= buckets[0] && bucket <= buckets[1] ? count : 0;
+            });
+            return {
+                platform: platform, byYear: byYear, byMonth: byMonth, histogram: histogram,
+                titles: titles, votes: votes, ratingSum: ratingSum
+            };
+        });
+    }
+
+    function growthChart(data, stats, template) {
+        var traces = stats.map(function (platformStats, i) {
+            var color = PLATFORM_COLORS[platformStats.platform] || '#3498db';
+            var years = Object.keys(platformStats.byYear).map(Number).sort(function (a, b) { return a - b; });
+            var rgb = [1, 3, 5].map(function (start) { return parseInt(color.slice(start, start + 2), 16); });
+            return {
+                type: 'scatter', mode: 'lines', name: platformStats.platform,
+                x: years, y: years.map(function (year) { return platformStats.byYear[year]; }),
+                line: {color: color, width: 3, shape: 'spline', smoothing: 0.3},
+                fill: i > 0 ? 'tonexty' : 'tozeroy',
+                fillcolor: 'rgba(' + rgb.join(', ') + ', 0.2)',
+                hovertemplate: '<b>' + platformStats.platform + '</b><br>Year: %{x}<br>Titles: %{y}<br><extra></extra>'
+            };
+        });
+        var axis = {
+            showgrid: true, gridcolor: 'rgba(0,0,0,0.1)', gridwidth: 1,
+            showline: true, linecolor: 'rgba(0,0,0,0.1)', linewidth: 1
+        };
+        return {
+            data: traces,
+            layout: {
+                template: template,
+                xaxis: Object.assign({title: {text: 'Release Year'}}, axis),
+                yaxis: Object.assign({title: {text: 'Number of Titles'}}, axis),
+                font: {size: 13, family: FONT},
+                plot_bgcolor: 'rgba(0,0,0,0)', paper_bgcolor: 'rgba(0,0,0,0)',
+                showlegend: true,
+                legend: {orientation: 'h', yanchor: 'bottom', y: 1.02, xanchor: 'right', x: 1,
+                         font: {size: 12, family: FONT}},
+                margin: {t: 60, l: 60, r: 40, b: 60},
+                hovermode: 'x unified'
+            }
+        };
+    }
+
+    function worldMap(counts, data) {
+        if (!counts.length) {
+            return message('No data available for the selected filters', data.template);
+        }
+        return {
+            data: [{
+                type: 'choropleth', locationmode: 'country names', coloraxis: 'coloraxis', geo: 'geo', name: '',
+                locations: counts.map(function (entry) { return entry[0]; }),
+                z: counts.map(function (entry) { return entry[1]; }),
+                hovertemplate: 'country=%{location}<br>Content Count=%{z}<extra></extra>'
+            }],
+            layout: {
+                template: data.template,
+                coloraxis: {colorscale: data.colorscales.Viridis, colorbar: {title: {text: 'Content Count'}}},
+                geo: {domain: {x: [0, 1], y: [0, 1]}, center: {}, showframe: false, showcoastlines: true},
+                legend: {tracegroupgap: 0},
+                margin: {t: 60},
+                font: {size: 12, family: FONT},
+                plot_bgcolor: 'rgba(0,0,0,0)', paper_bgcolor: 'rgba(0,0,0,0)'
+            }
+        };
+    }
+
+    function genreHeatmap(data, selected, yearRange, buckets) {
+        // Top 10 genres per platform, pivoted with genres and platforms in sorted order
+        var cells = {};
+        selected.forEach(function (platform) {
+            var bit = platformBits(data.platforms, [platform]);
+            valueCounts(data.genres, selectRows(data.genres, bit, yearRange, buckets)).slice(0, 10)
+                .forEach(function (entry) {
+                    cells[entry[0]] = cells[entry[0]] || {};
+                    cells[entry[0]][platform] = entry[1];
+                });
+        });
+        var genres = Object.keys(cells).sort();
+        if (!genres.length) {
+            return message('No genre data available for the selected filters', data.template);
+        }
+        var platforms = selected.filter(function (platform) {
+            return genres.some(function (genre) { return platform in cells[genre]; });
+        }).sort();
+        return {
+            data: [{
+                type: 'heatmap', coloraxis: 'coloraxis', name: '0', x: platforms, y: genres,
+                z: genres.map(function (genre) {
+                    return platforms.map(function (platform) { return cells[genre][platform] || 0; });
+                }),
+                hovertemplate: 'Platform: %{x}<br>Genre: %{y}<br>color: %{z}<extra></extra>'
+            }],
+            layout: {
+                template: data.template,
+                xaxis: {anchor: 'y', domain: [0, 1], title: {text: 'Streaming Platform'}},
+                yaxis: {anchor: 'x', domain: [0, 1], autorange: 'reversed', title: {text: 'Content Genre'}},
+                coloraxis: {colorscale: data.colorscales.Blues},
+                margin: {t: 60},
+                font: {size: 12, family: FONT},
+                plot_bgcolor: 'rgba(0,0,0,0)', paper_bgcolor: 'rgba(0,0,0,0)'
+            }
+        };
+    }
+
+    // Box plot statistics of a rating bucket histogram, as in queries.histogram_quartiles
+    function histogramQuartiles(histogram) {
+        var total = histogram.reduce(function (a, b) { return a + b; }, 0);
+        var present = [], cumulative = [], running = 0;
+        histogram.forEach(function (count, bucket) {
+            if (count > 0) {
+                present.push(bucket);
+            }
+            running += count;
+            cumulative.push(running / total);
+        });
+        function quantile(q) {
+            for (var bucket = 0; bucket < cumulative.length; bucket++) {
+                if (cumulative[bucket] >= q) {
+                    return bucket / 4;
+                }
+            }
+            return (cumulative.length - 1) / 4;
+        }
+        return {
+            q1: [quantile(0.25)], median: [quantile(0.5)], q3: [quantile(0.75)],
+            lowerfence: [present[0] / 4], upperfence: [present[present.length - 1] / 4]
+        };
+    }
+
+    function platformComparison(stats, template) {
+        var withTitles = stats.filter(function (platformStats) { return platformStats.titles > 0; });
+        if (!withTitles.length) {
+            return message('No data available for the selected filters', template);
+        }
+        var names = withTitles.map(function (platformStats) { return platformStats.platform; });
+        function bar(values, color, axis) {
+            return {type: 'bar', x: names, y: values, marker: {color: color}, showlegend: false,
+                    xaxis: 'x' + axis, yaxis: 'y' + axis};
+        }
+        var traces = [
+            bar(withTitles.map(function (s) { return s.ratingSum / s.titles; }), COMPARISON_COLORS[0], ''),
+            bar(withTitles.map(function (s) { return s.titles; }), COMPARISON_COLORS[1], '2'),
+            bar(withTitles.map(function (s) { return s.votes; }), COMPARISON_COLORS[2], '3')
+        ];
+        stats.forEach(function (platformStats, i) {
+            if (platformStats.titles > 0) {
+                traces.push(Object.assign({
+                    type: 'box', x: [platformStats.platform], name: platformStats.platform,
+                    line: {color: COMPARISON_COLORS[i % COMPARISON_COLORS.length]}, showlegend: false,
+                    xaxis: 'x4', yaxis: 'y4'
+                }, histogramQuartiles(platformStats.histogram)));
+            }
+        });
+        var titles = ['Average Rating', 'Total Content', 'Total Engagement', 'Rating Distribution'];
+        var xDomains = [[0, 0.45], [0.55, 1], [0, 0.45], [0.55, 1]];
+        var yDomains = [[0.625, 1], [0.625, 1], [0, 0.375], [0, 0.375]];
+        var layout = {
+            template: template, height: 500, font: {size: 10, family: FONT},
+            annotations: titles.map(function (text, i) {
+                return {
+                    text: text, font: {size: 16}, showarrow: false,
+                    x: (xDomains[i][0] + xDomains[i][1]) / 2, xanchor: 'center', xref: 'paper',
+                    y: yDomains[i][1], yanchor: 'bottom', yref: 'paper'
+                };
+            })
+        };
+        titles.forEach(function (_, i) {
+            var suffix = i ? String(i + 1) : '';
+            layout['xaxis' + suffix] = {anchor: 'y' + suffix, domain: xDomains[i]};
+            layout['yaxis' + suffix] = {anchor: 'x' + suffix, domain: yDomains[i]};
+        });
+        return {data: traces, layout: layout};
+    }
+
+    function countriesBar(counts, template, colorscales) {
+        if (!counts.length) {
+            return message('No data available for the selected filters', template);
+        }
+        var top = counts.slice(0, 15);
+        var values = top.map(function (entry) { return entry[1]; });
+        return {
+            data: [{
+                type: 'bar', orientation: 'h', name: '', showlegend: false,
+                x: values, y: top.map(function (entry) { return entry[0]; }),
+                marker: {color: values, coloraxis: 'coloraxis'},
+                hovertemplate: 'x=%{x}<br>y=%{y}<br>color=%{marker.color}<extra></extra>'
+            }],
+            layout: {
+                template: template,
+                coloraxis: {colorscale: colorscales.Viridis, colorbar: {title: {text: 'color'}}},
+                barmode: 'relative', legend: {tracegroupgap: 0}, margin: {t: 60},
+                xaxis: Object.assign({title: {text: 'Number of Titles'}}, gridAxis()),
+                yaxis: Object.assign({title: {text: 'Country'}}, gridAxis()),
+                font: {size: 12, family: FONT},
+                plot_bgcolor: 'rgba(0,0,0,0)', paper_bgcolor: 'rgba(0,0,0,0)',
+                showlegend: false
+            }
+        };
+    }
+
+    function seasonalChart(stats, template) {
+        // Month 0 counts titles without a release date, they are not plotted
+        var traces = stats.filter(function (platformStats) {
+            return platformStats.byMonth.some(function (count) { return count > 0; });
+        }).map(function (platformStats) {
+            return {
+                type: 'scatter', mode: 'lines+markers', name: platformStats.platform,
+                legendgroup: platformStats.platform, showlegend: true,
+                x: MONTH_NAMES, y: platformStats.byMonth.slice(1),
+                hovertemplate: 'Platform=' + platformStats.platform + '<br>Month=%{x}<br>Count=%{y}<extra></extra>'
+            };
+        });
+        if (!traces.length) {
+            return message('No seasonal data available for the selected filters', template);
+        }
+        return {
+            data: traces,
+            layout: {
+                template: template,
+                legend: {title: {text: 'Platform'}, tracegroupgap: 0}, margin: {t: 60},
+                xaxis: Object.assign({title: {text: 'Month'}}, gridAxis()),
+                yaxis: Object.assign({title: {text: 'Number of Releases'}}, gridAxis()),
+                font: {size: 12, family: FONT},
+                plot_bgcolor: 'rgba(0,0,0,0)', paper_bgcolor: 'rgba(0,0,0,0)'
+            }
+        };
+    }
+
+    function correlationChart(data, bits, yearRange, buckets) {
+        // Pearson's r from the sums of the selected cells, as cube.pearson does
+        var cells = data.cells, moments = data.moments;
+        var n = 0, x = 0, y = 0, xx = 0, yy = 0, xy = 0;
+        selectRows(cells, bits, yearRange, buckets).forEach(function (i) {
+            n += cells.count[i];
+            x += cells.rating_sum[i];
+            y += cells.votes[i];
+        });
+        if (n === 0) {
+            return message('No data available for the selected filters', data.template);
+        }
+        selectRows(moments, bits, yearRange, buckets).forEach(function (i) {
+            xx += moments.rating_squares[i];
+            yy += moments.vote_squares[i];
+            xy += moments.rating_votes[i];
+        });
+        var spread = (n * xx - x * x) * (n * yy - y * y);
+        var correlation = spread > 0 ? (n * xy - x * y) / Math.sqrt(spread) : NaN;
+
+        // Density of titles per (vote bin, rating bucket)
+        var tally = data.vote_bins, density = new Map(), usedBuckets = new Set();
+        selectRows(tally, bits, yearRange, buckets).forEach(function (i) {
+            var voteBin = tally.values[tally.value[i]];
+            var row = density.get(voteBin) || {label: tally.labels[tally.value[i]], counts: {}};
+            row.counts[tally.bucket[i]] = (row.counts[tally.bucket[i]] || 0) + tally.count[i];
+            density.set(voteBin, row);
+            usedBuckets.add(tally.bucket[i]);
+        });
+        var columns = Array.from(usedBuckets).sort(function (a, b) { return a - b; });
+        var rows = Array.from(density.keys()).sort(function (a, b) { return a - b; }).map(function (voteBin) {
+            return density.get(voteBin);
+        });
+        return {
+            data: [{
+                type: 'heatmap', colorscale: data.colorscales.Blues, showscale: false,
+                x: columns.map(function (bucket) { return bucket / 4; }),
+                y: rows.map(function (row) { return row.label; }),
+                z: rows.map(function (row) {
+                    return columns.map(function (bucket) { return row.counts[bucket] || 0; });
+                }),
+                hovertemplate: 'Rating: %{x}<br>Votes: %{y}<br>Titles: %{z}<extra></extra>'
+            }],
+            layout: {
+                template: data.template,
+                xaxis: Object.assign({title: {text: 'Average Rating'}}, gridAxis()),
+                yaxis: Object.assign({title: {text: 'Total Votes'}}, gridAxis()),
+                font: {size: 12, family: FONT},
+                plot_bgcolor: 'rgba(0,0,0,0)', paper_bgcolor: 'rgba(0,0,0,0)',
+                annotations: [{
+                    x: 0.05, y: 0.95, xref: 'paper', yref: 'paper',
+                    text: 'Correlation: ' + (isNaN(correlation) ? 'nan' : correlation.toFixed(3)),
+                    showarrow: false,
+                    font: {size: 14, color: '#2c3e50', family: FONT},
+                    bgcolor: 'rgba(255,255,255,0.8)', bordercolor: '#bdc3c7', borderwidth: 1
+                }]
+            }
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            update: function (selectedPlatforms, yearRange, ratingRange, data) {
+                if (!data) {
+                    return new Array(8).fill(window.dash_clientside.no_update);
+                }
+                // Platforms in selector order, like the server-side figure cache
+                var selected = data.platforms.filter(function (platform) {
+                    return (selectedPlatforms || []).indexOf(platform) >= 0;
+                });
+                var cards = metrics(data, selected, platformBits(data.platforms, selected), yearRange,
+                                    bucketRange(ratingRange));
+                if (!selected.length) {
+                    var prompt = message('Please select at least one streaming platform', data.template);
+                    return [cards].concat(new Array(7).fill(prompt));
+                }
+                var bits = platformBits(data.platforms, selected);
+                var buckets = bucketRange(ratingRange);
+                var stats = platformCounts(data, selected, yearRange, buckets);
+                var countryCounts = valueCounts(data.countries, selectRows(data.countries, bits, yearRange, buckets));
+                return [
+                    cards,
+                    growthChart(data, stats, data.template),
+                    worldMap(countryCounts, data),
+                    genreHeatmap(data, selected, yearRange, buckets),
+                    platformComparison(stats, data.template),
+                    countriesBar(countryCounts, data.template, data.colorscales),
+                    seasonalChart(stats, data.template),
+                    correlationChart(data, bits, yearRange, buckets)
+                ];
+            }
+        }
+    });
+})();
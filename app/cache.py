@@ -0,0 +1,193 @@
+# Binary columnar cache of the prepared frames
+#
+# Each frame is stored as a directory with one .npy file per column plus a
+# meta.json describing how to rebuild it.  String columns are dictionary
+# encoded (int32 codes plus the distinct values as one UTF-8 buffer with
+# offsets), categorical columns keep their own codes and categories the same
+# way, and list columns are stored flattened with per-row lengths, so
+# nothing goes through pickle and every array can be loaded straight from
+# disk.
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 6
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path, cache_dir):
+    """Content hash of ``path``, reusing the last hash while mtime and size are unchanged"""
+    stat = os.stat(path)
+    pointer_path = os.path.join(cache_dir, os.path.basename(path) + '.json')
+    try:
+        with open(pointer_path) as f:
+            pointer = json.load(f)
+        if (pointer['path'] == os.path.abspath(path) and pointer['mtime_ns'] == stat.st_mtime_ns
+                and pointer['size'] == stat.st_size):
+            return pointer['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha256 = file_sha256(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_json(pointer_path, {
+        'path': os.path.abspath(path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256,
+    })
+    return sha256
+
+
+def _write_json(path, payload):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _encode_strings(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(data, offsets):
+    buffer = data.tobytes()
+    return np.array(
+        [buffer[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])],
+        dtype=object
+    )
+
+
+def _is_list_column(series):
+    non_null = series.dropna()
+    return len(non_null) > 0 and isinstance(non_null.iloc[0], list)
+
+
+def save_frame(df, directory):
+    os.makedirs(directory)
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        prefix = os.path.join(directory, str(i))
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            data, offsets = _encode_strings(series.cat.categories)
+            np.save(prefix + '.npy', series.cat.codes.to_numpy())
+            np.save(prefix + '.data.npy', data)
+            np.save(prefix + '.offsets.npy', offsets)
+            columns.append({'name': name, 'kind': 'category'})
+            continue
+        if series.dtype != object:
+            np.save(prefix + '.npy', series.to_numpy())
+            columns.append({'name': name, 'kind': 'array'})
+            continue
+
+        if _is_list_column(series):
+            lengths = np.fromiter((len(value) for value in series), dtype=np.int64, count=len(series))
+            values = pd.Series([item for value in series for item in value], dtype=object)
+            np.save(prefix + '.lengths.npy', lengths)
+            kind = 'list'
+        else:
+            values = series
+            kind = 'string'
+        codes, uniques = pd.factorize(values)
+        data, offsets = _encode_strings(uniques)
+        np.save(prefix + '.npy', codes.astype(np.int32))
+        np.save(prefix + '.data.npy', data)
+        np.save(prefix + '.offsets.npy', offsets)
+        columns.append({'name': name, 'kind': kind})
+
+    _write_json(os.path.join(directory, 'meta.json'), {'columns': columns, 'rows': len(df)})
+
+
+def load_frame(directory, mmap_mode=None):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        prefix = os.path.join(directory, str(i))
+        values = np.load(prefix + '.npy', mmap_mode=mmap_mode)
+        if column['kind'] == 'category':
+            categories = _decode_strings(np.load(prefix + '.data.npy'), np.load(prefix + '.offsets.npy'))
+            data[column['name']] = pd.Categorical.from_codes(values, categories)
+            continue
+        if column['kind'] != 'array':
+            uniques = _decode_strings(np.load(prefix + '.data.npy'), np.load(prefix + '.offsets.npy'))
+            # Code -1 marks a missing value
+            values = np.append(uniques, np.nan)[values]
+        if column['kind'] == 'list':
+            lengths = np.load(prefix + '.lengths.npy')
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+            items = list(values)
+            values = pd.Series([items[start:end] for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+        data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def cache_path(data_path, cache_dir, platforms):
+    """Directory of the cache entry for ``data_path`` in its current state"""
+    sha256 = source_fingerprint(data_path, cache_dir)
+    stem = os.path.splitext(os.path.basename(data_path))[0]
+    key = hashlib.sha256(json.dumps([sha256, list(platforms), CACHE_VERSION]).encode()).hexdigest()
+    return os.path.join(cache_dir, f'{stem}-{key[:16]}')
+
+
+def save_arrays(arrays, directory):
+    os.makedirs(directory)
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), values)
+
+
+def load_arrays(directory, mmap_mode=None):
+    return {
+        os.path.splitext(name)[0]: np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+        for name in os.listdir(directory) if name.endswith('.npy')
+    }
+
+
+def read_cache(path, mmap_mode=None):
+    """Return the cached ``(df, countries_df, index_arrays)``, or ``None`` when there is no entry
+
+    With ``mmap_mode='r'`` every numeric column is a read-only memory map of
+    the cache files, so processes reading the same entry share its pages.
+    """
+    if not os.path.isdir(path):
+        return None
+    return (
+        load_frame(os.path.join(path, 'titles'), mmap_mode),
+        load_frame(os.path.join(path, 'countries'), mmap_mode),
+        load_arrays(os.path.join(path, 'indexes'), mmap_mode),
+    )
+
+
+def write_cache(path, df, countries_df, index_arrays):
+    """Write the frames and index arrays to a scratch directory and move it into place atomically"""
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        save_frame(df, os.path.join(scratch, 'titles'))
+        save_frame(countries_df, os.path.join(scratch, 'countries'))
+        save_arrays(index_arrays, os.path.join(scratch, 'indexes'))
+        os.rename(scratch, path)
+    except OSError:
+        # Another process finished the same entry first
+        if not os.path.exists(path):
+            raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
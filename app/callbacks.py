@@ -1,19 +1,59 @@
 # Dashboard callbacks
-from dash import Input, Output, html
+from dash import Input, Output, State, html
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 
-def register_callbacks(app, df, countries_df, platforms):
+from cube import rank_counts
+from patches import patching, structure_store_id
+
+# Above this many titles the correlation chart is a density heatmap instead
+# of one point per title (plotly switches the scatter to WebGL past 1,000)
+SCATTER_MAX_POINTS = 10_000
+
+def register_callbacks(app, catalog, figures, combined=False, timings=None, latest=None, patch=False):
+    # Each callback answers from one catalog.snapshot(), a FrameQueries or a
+    # SummaryQueries (see queries.py), even if titles are appended meanwhile.
+    # catalog may be a catalogs.Catalogs, which resolves the catalog of each
+    # request from the page that sent it.
+    # Chart figures are served from the FigureCache when the state repeats.
+    # With combined=True the metrics and every chart are served by a single
+    # multi-output callback, one request per interaction instead of eight.
+    # With timings (a CallbackTimings) enabled, each chart's stages are timed.
+    # With latest (a LatestRequests), requests overtaken by a newer one from
+    # the same browser are dropped.
+    # With patch=True, a chart whose structure the browser already shows is
+    # sent a Patch of its data arrays (see patches.py); the layout needs a
+    # store with structure_store_id(chart) per chart.
+    builders = []
+
+    def guarded(name, build):
+        return build if latest is None else latest.guard(name)(build)
+
+    def dashboard_callback(output, inputs):
+        def decorator(build):
+            name = output.component_id
+            timed = (lambda callback: callback) if timings is None else timings.callback(name)
+            builders.append((output, inputs, timed(build)))
+            if not combined and patch and output.component_property == 'figure':
+                store = structure_store_id(name)
+                app.callback([output, Output(store, 'data')], inputs, State(store, 'data'))(
+                    guarded(name, timed(patching(build)))
+                )
+            elif not combined:
+                app.callback(output, inputs)(guarded(name, timed(build)))
+            return build
+        return decorator
     
-    @app.callback(
+    @dashboard_callback(
         Output('key-metrics', 'children'),
         [Input('platform-selector', 'value'),
          Input('year-slider', 'value'),
          Input('rating-slider', 'value')]
     )
     def update_metrics(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return [
@@ -47,18 +87,18 @@ def register_callbacks(app, df, countries_df, platforms):
                 }) for _ in range(3)
             ]
         
-        filtered_df = filter_data(df, selected_platforms, year_range, rating_range)
-        
-        total_titles = len(filtered_df)
-        avg_rating = filtered_df['vote_average'].mean() if len(filtered_df) > 0 else 0
-        total_countries = len(set([country for countries in filtered_df['country_names'] 
-                                 for country in countries if countries and len(filtered_df) > 0]))
+        total_titles, avg_rating, total_countries = queries.title_stats(selected_platforms, year_range, rating_range)
         
         metrics = [
             {'label': 'Total Titles', 'value': f"{total_titles:,}", 'color': '#3498db'},
             {'label': 'Avg Rating', 'value': f"{avg_rating:.1f}/10", 'color': '#e74c3c'},
             {'label': 'Countries', 'value': f"{total_countries}", 'color': '#2ecc71'}
         ]
+        if queries.approximate:
+            # Estimated from sketches, marked with their standard error
+            error = queries.error_bounds(selected_platforms, year_range, rating_range)['countries']
+            metrics[2]['value'] = f"~{total_countries}"
+            metrics[2]['label'] = f"Countries (±{error:.0%})"
         
         return [
             html.Div([
@@ -91,11 +131,13 @@ def register_callbacks(app, df, countries_df, platforms):
             }) for metric in metrics
         ]
     
-    @app.callback(
+    @dashboard_callback(
         Output('netflix-growth-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('netflix-growth-chart')
     def update_netflix_growth(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -106,10 +148,7 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_df = df[
-            (df['Year'] >= year_range[0]) & (df['Year'] <= year_range[1]) &
-            (df['vote_average'] >= rating_range[0]) & (df['vote_average'] <= rating_range[1])
-        ]
+        years, year_counts = queries.cube.platform_year_counts(selected_platforms, year_range, rating_range)
         
         # Modern platform colors with better contrast
         platform_colors = {
@@ -123,28 +162,28 @@ def register_callbacks(app, df, countries_df, platforms):
         
         # Create smooth area charts for each platform
         for i, platform in enumerate(selected_platforms):
-            if platform in filtered_df.columns:
-                platform_growth = filtered_df[filtered_df[platform] == 1].groupby('Year').size().reset_index(name='count')
-                
-                # Add smooth area trace
-                fig.add_trace(go.Scatter(
-                    x=platform_growth['Year'],
-                    y=platform_growth['count'],
-                    mode='lines',
-                    name=platform,
-                    line=dict(
-                        color=platform_colors.get(platform, '#3498db'), 
-                        width=3,
-                        shape='spline',
-                        smoothing=0.3
-                    ),
-                    fill='tonexty' if i > 0 else 'tozeroy',
-                    fillcolor=f"rgba{tuple(list(bytes.fromhex(platform_colors.get(platform, '#3498db')[1:])) + [0.2])}",
-                    hovertemplate=f'<b>{platform}</b><br>' +
-                                 'Year: %{x}<br>' +
-                                 'Titles: %{y}<br>' +
-                                 '<extra></extra>'
-                ))
+            counts = year_counts[i]
+            has_titles = counts > 0
+            
+            # Add smooth area trace
+            fig.add_trace(go.Scatter(
+                x=years[has_titles],
+                y=counts[has_titles],
+                mode='lines',
+                name=platform,
+                line=dict(
+                    color=platform_colors.get(platform, '#3498db'), 
+                    width=3,
+                    shape='spline',
+                    smoothing=0.3
+                ),
+                fill='tonexty' if i > 0 else 'tozeroy',
+                fillcolor=f"rgba{tuple(list(bytes.fromhex(platform_colors.get(platform, '#3498db')[1:])) + [0.2])}",
+                hovertemplate=f'<b>{platform}</b><br>' +
+                             'Year: %{x}<br>' +
+                             'Titles: %{y}<br>' +
+                             '<extra></extra>'
+            ))
         
         fig.update_layout(
             xaxis_title="Release Year",
@@ -185,11 +224,13 @@ def register_callbacks(app, df, countries_df, platforms):
         
         return fig
     
-    @app.callback(
+    @dashboard_callback(
         Output('world-map-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('world-map-chart')
     def update_world_map(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -200,9 +241,9 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_countries_df = filter_countries_data(countries_df, selected_platforms, year_range, rating_range)
+        country_counts = queries.country_counts(selected_platforms, year_range, rating_range)
         
-        if len(filtered_countries_df) == 0:
+        if len(country_counts) == 0:
             return go.Figure().add_annotation(
                 text="No data available for the selected filters",
                 xref="paper", yref="paper",
@@ -211,7 +252,7 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        country_counts = filtered_countries_df['country'].value_counts().reset_index()
+        country_counts = country_counts.reset_index()
         country_counts.columns = ['country', 'content_count']
         
         fig = px.choropleth(
@@ -221,7 +262,7 @@ def register_callbacks(app, df, countries_df, platforms):
             locationmode='country names',
             color_continuous_scale='Viridis',
             title='',
-            labels={'content_count': 'Content Count'}
+            labels={'content_count': 'Content Count (approx.)' if queries.approximate else 'Content Count'}
         )
         
         fig.update_layout(
@@ -233,11 +274,13 @@ def register_callbacks(app, df, countries_df, platforms):
         
         return fig
     
-    @app.callback(
+    @dashboard_callback(
         Output('genre-heatmap-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('genre-heatmap-chart')
     def update_genre_heatmap(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -248,14 +291,13 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_df = filter_data(df, selected_platforms, year_range, rating_range)
-        
-        # Create platform-genre matrix
+        # Create platform-genre matrix, from the top 10 genres of each platform
+        all_genre_counts = queries.genre_counts(selected_platforms, year_range, rating_range)
         platform_genre_data = []
         for platform in selected_platforms:
-            platform_data = filtered_df[filtered_df[platform] == 1]
-            if len(platform_data) > 0:
-                genre_counts = platform_data['genres'].value_counts().head(10)
+            genre_counts = all_genre_counts[platform]
+            genre_counts = rank_counts(genre_counts[genre_counts > 0]).head(10)
+            if len(genre_counts) > 0:
                 for genre, count in genre_counts.items():
                     platform_genre_data.append({
                         'Platform': platform,
@@ -282,6 +324,10 @@ def register_callbacks(app, df, countries_df, platforms):
             aspect='auto'
         )
         
+        if queries.approximate:
+            undercount = queries.error_bounds(selected_platforms, year_range, rating_range)['genre_counts']
+            fig.update_coloraxes(colorbar_title_text=f"Approximate<br>(up to {undercount:,} low)")
+        
         fig.update_layout(
             xaxis_title="Streaming Platform",
             yaxis_title="Content Genre",
@@ -292,11 +338,13 @@ def register_callbacks(app, df, countries_df, platforms):
         
         return fig
     
-    @app.callback(
+    @dashboard_callback(
         Output('platform-comparison-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('platform-comparison-chart')
     def update_platform_comparison(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -307,17 +355,16 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_df = filter_data(df, selected_platforms, year_range, rating_range)
+        counts, votes, rating_sums = queries.cube.platform_totals(selected_platforms, year_range, rating_range)
         
         platform_stats = []
-        for platform in selected_platforms:
-            platform_data = filtered_df[filtered_df[platform] == 1]
-            if len(platform_data) > 0:
+        for i, platform in enumerate(selected_platforms):
+            if counts[i] > 0:
                 platform_stats.append({
                     'Platform': platform,
-                    'Average Rating': platform_data['vote_average'].mean(),
-                    'Total Content': len(platform_data),
-                    'Total Votes': platform_data['vote_count'].sum()
+                    'Average Rating': rating_sums[i] / counts[i],
+                    'Total Content': counts[i],
+                    'Total Votes': votes[i]
                 })
         
         if not platform_stats:
@@ -362,23 +409,37 @@ def register_callbacks(app, df, countries_df, platforms):
         )
         
         # Rating Distribution
-        for i, platform in enumerate(selected_platforms):
-            platform_data = filtered_df[filtered_df[platform] == 1]['vote_average'].dropna()
-            if len(platform_data) > 0:
-                fig.add_trace(
-                    go.Violin(y=platform_data, name=platform, 
-                             line_color=colors[i % len(colors)], showlegend=False),
-                    row=2, col=2
-                )
+        if queries.has_rows:
+            for i, platform in enumerate(selected_platforms):
+                platform_data = queries.platform_ratings(platform, selected_platforms, year_range, rating_range)
+                if len(platform_data) > 0:
+                    fig.add_trace(
+                        go.Violin(y=platform_data, name=platform, 
+                                 line_color=colors[i % len(colors)], showlegend=False),
+                        row=2, col=2
+                    )
+        else:
+            # Without title rows the distribution is drawn from the cube's rating histogram
+            quartiles = queries.rating_quartiles(selected_platforms, year_range, rating_range)
+            for i, (platform, stats) in enumerate(zip(selected_platforms, quartiles)):
+                if stats is not None:
+                    fig.add_trace(
+                        go.Box(x=[platform], q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+                               lowerfence=[stats['lowerfence']], upperfence=[stats['upperfence']],
+                               name=platform, line_color=colors[i % len(colors)], showlegend=False),
+                        row=2, col=2
+                    )
         
         fig.update_layout(height=500, font=dict(size=10, family='Montserrat, sans-serif'))
         return fig
     
-    @app.callback(
+    @dashboard_callback(
         Output('countries-bar-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('countries-bar-chart')
     def update_countries_bar(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -389,10 +450,10 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_countries_df = filter_countries_data(countries_df, selected_platforms, year_range, rating_range)
+        country_counts = queries.country_counts(selected_platforms, year_range, rating_range)
         
         # Handle empty filtered data
-        if len(filtered_countries_df) == 0:
+        if len(country_counts) == 0:
             return go.Figure().add_annotation(
                 text="No data available for the selected filters",
                 xref="paper", yref="paper",
@@ -402,7 +463,7 @@ def register_callbacks(app, df, countries_df, platforms):
             )
         
         # Get top countries across all selected platforms
-        country_counts = filtered_countries_df['country'].value_counts().head(15)
+        country_counts = country_counts.head(15)
         
         # Handle case where country_counts is empty
         if len(country_counts) == 0:
@@ -423,8 +484,15 @@ def register_callbacks(app, df, countries_df, platforms):
             color_continuous_scale='Viridis'
         )
         
+        x_title = "Number of Titles"
+        if queries.approximate:
+            # Sketch counts are never too high; the error bars reach the most they may be too low
+            undercount = queries.error_bounds(selected_platforms, year_range, rating_range)['country_counts']
+            x_title = f"Number of Titles (approximate, up to {undercount:,} low)"
+            fig.update_traces(error_x=dict(type='constant', symmetric=False, value=undercount, valueminus=0))
+        
         fig.update_layout(
-            xaxis_title="Number of Titles",
+            xaxis_title=x_title,
             yaxis_title="Country",
             font=dict(size=12, family='Montserrat, sans-serif'),
             plot_bgcolor='rgba(0,0,0,0)',
@@ -436,11 +504,13 @@ def register_callbacks(app, df, countries_df, platforms):
         
         return fig
     
-    @app.callback(
+    @dashboard_callback(
         Output('seasonal-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('seasonal-chart')
     def update_seasonal_chart(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -451,18 +521,17 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_df = filter_data(df, selected_platforms, year_range, rating_range)
+        month_counts = queries.cube.platform_month_counts(selected_platforms, year_range, rating_range)
         
         # Create monthly release patterns data
         monthly_data = []
         month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
         
-        for platform in selected_platforms:
-            platform_data = filtered_df[filtered_df[platform] == 1]
-            if 'release_month' in platform_data.columns and len(platform_data) > 0:
-                monthly_counts = platform_data.groupby('release_month').size()
+        for i, platform in enumerate(selected_platforms):
+            # Month 0 counts titles without a release date, they are not plotted
+            if month_counts[i].sum() > 0:
                 for month in range(1, 13):
-                    count = monthly_counts.get(month, 0)
+                    count = month_counts[i, month]
                     monthly_data.append({
                         'Platform': platform,
                         'Month': month_names[month-1],
@@ -495,11 +564,13 @@ def register_callbacks(app, df, countries_df, platforms):
         
         return fig
     
-    @app.callback(
+    @dashboard_callback(
         Output('correlation-chart', 'figure'),
         [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value')]
     )
+    @figures.cached('correlation-chart')
     def update_correlation_chart(selected_platforms, year_range, rating_range):
+        queries = catalog.snapshot()
         # Handle empty platform selection
         if not selected_platforms:
             return go.Figure().add_annotation(
@@ -510,30 +581,40 @@ def register_callbacks(app, df, countries_df, platforms):
                 showarrow=False
             )
         
-        filtered_df = filter_data(df, selected_platforms, year_range, rating_range)
-        
-        # Create scatter plot of ratings vs vote count
-        correlation_data = filtered_df[['vote_average', 'vote_count']].dropna()
+        no_data = go.Figure().add_annotation(
+            text="No data available for the selected filters",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, xanchor='center', yanchor='middle',
+            font=dict(size=16, color="#6c757d", family='Montserrat, sans-serif'),
+            showarrow=False
+        )
         
-        if len(correlation_data) == 0:
-            return go.Figure().add_annotation(
-                text="No data available for the selected filters",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, xanchor='center', yanchor='middle',
-                font=dict(size=16, color="#6c757d", family='Montserrat, sans-serif'),
-                showarrow=False
+        # Pearson's r comes from the cube's sums, never from the title rows
+        total, correlation = queries.correlation(selected_platforms, year_range, rating_range)
+        
+        if total == 0:
+            return no_data
+        
+        if queries.has_rows and total <= SCATTER_MAX_POINTS:
+            # Create scatter plot of ratings vs vote count
+            correlation_data = queries.rating_votes(selected_platforms, year_range, rating_range)
+            
+            fig = px.scatter(
+                correlation_data, 
+                x='vote_average', 
+                y='vote_count',
+                title='',
+                opacity=0.6,
+                color_discrete_sequence=['#3498db']
             )
-        
-        correlation = correlation_data.corr().iloc[0, 1]
-        
-        fig = px.scatter(
-            correlation_data, 
-            x='vote_average', 
-            y='vote_count',
-            title='',
-            opacity=0.6,
-            color_discrete_sequence=['#3498db']
-        )
+        else:
+            # Too many points to ship, plot the density of titles per rating bucket and vote bin
+            ratings, vote_labels, density = queries.rating_vote_density(selected_platforms, year_range, rating_range)
+            fig = go.Figure(go.Heatmap(
+                x=ratings, y=vote_labels, z=density,
+                colorscale='Blues', showscale=False,
+                hovertemplate='Rating: %{x}<br>Votes: %{y}<br>Titles: %{z}<extra></extra>'
+            ))
         
         fig.update_layout(
             xaxis_title="Average Rating",
@@ -561,26 +642,11 @@ def register_callbacks(app, df, countries_df, platforms):
         
         return fig
 
-def filter_data(df, selected_platforms, year_range, rating_range):
-    if not selected_platforms:
-        return pd.DataFrame()  # Return empty DataFrame if no platforms selected
-    
-    platform_filter = df[selected_platforms].sum(axis=1) > 0
-    filtered_df = df[
-        platform_filter &
-        (df['Year'] >= year_range[0]) & (df['Year'] <= year_range[1]) &
-        (df['vote_average'] >= rating_range[0]) & (df['vote_average'] <= rating_range[1])
-    ]
-    return filtered_df
+    if combined:
+        def update_dashboard(selected_platforms, year_range, rating_range):
+            # Every builder answers from the same snapshot, and the filter
+            # result they share is computed once (see FilterResult)
+            with catalog.pinned():
+                return [build(selected_platforms, year_range, rating_range) for _, _, build in builders]
 
-def filter_countries_data(countries_df, selected_platforms, year_range, rating_range):
-    if not selected_platforms:
-        return pd.DataFrame()  # Return empty DataFrame if no platforms selected
-        
-    platform_filter = countries_df[selected_platforms].sum(axis=1) > 0
-    filtered_df = countries_df[
-        platform_filter &
-        (countries_df['Year'] >= year_range[0]) & (countries_df['Year'] <= year_range[1]) &
-        (countries_df['vote_average'] >= rating_range[0]) & (countries_df['vote_average'] <= rating_range[1])
-    ]
-    return filtered_df
+        app.callback([output for output, _, _ in builders], builders[0][1])(guarded('dashboard', update_dashboard))
@@ -0,0 +1,126 @@
+# Live catalog: the current query snapshot, and appends of new title batches
+#
+# Callbacks take one snapshot per request and use only that, so a batch
+# appended while a request runs is never seen half applied.  An append
+# builds the next snapshot next to the current one and publishes it by
+# swapping a single reference.
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog:
+    """Holds the current ``FrameQueries`` or ``SummaryQueries`` and swaps in a new one per append"""
+
+    def __init__(self, queries):
+        # (batches appended so far, queries), swapped as one reference
+        self._current = (0, queries)
+        # Appends are applied one at a time, readers never wait
+        self._lock = threading.Lock()
+        self.appended_titles = 0
+        self._pinned = threading.local()
+
+    def _state(self):
+        pinned = getattr(self._pinned, 'state', None)
+        return self._current if pinned is None else pinned
+
+    def snapshot(self):
+        return self._state()[1]
+
+    def version(self):
+        """Number of batches appended before the snapshot ``snapshot()`` returns"""
+        return self._state()[0]
+
+    @property
+    def batches(self):
+        return self._current[0]
+
+    @contextmanager
+    def pinned(self):
+        """Make ``snapshot()`` on this thread return the same snapshot until exit
+
+        Nested uses keep the outermost snapshot.
+        """
+        if getattr(self._pinned, 'state', None) is not None:
+            yield self.snapshot()
+            return
+        self._pinned.state = self._current
+        try:
+            yield self.snapshot()
+        finally:
+            self._pinned.state = None
+
+    def append(self, batch):
+        """Append a frame of new titles with the CSV's columns, returns the number of titles added"""
+        with self._lock:
+            batches, queries = self._current
+            self._current = (batches + 1, queries.appended(batch))
+            self.appended_titles += len(batch)
+        return len(batch)
+
+    def append_csv(self, path):
+        return self.append(pd.read_csv(path))
+
+
+class DropFolder:
+    """Appends each CSV file that appears in ``folder`` to ``catalog``, once
+
+    A file is picked up when its size and modification time have not changed
+    since the previous poll, so a file still being copied in is not read half
+    written.  Files are appended in name order and left in place: every
+    worker process watches the folder on its own, and a restarted process
+    loads the base catalog and then every dropped file again.
+    """
+
+    def __init__(self, catalog, folder, interval=5.0):
+        self.catalog = catalog
+        self.folder = folder
+        self.interval = interval
+        self.seen = set()
+        self._stats = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Append the complete files not appended yet, returns their names"""
+        appended = []
+        stats = {}
+        for entry in sorted(os.scandir(self.folder), key=lambda entry: entry.name):
+            if not entry.name.endswith('.csv') or entry.name in self.seen:
+                continue
+            stat = entry.stat()
+            stats[entry.name] = (stat.st_size, stat.st_mtime_ns)
+            if self._stats.get(entry.name) != stats[entry.name]:
+                continue
+            self.seen.add(entry.name)
+            try:
+                titles = self.catalog.append_csv(entry.path)
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping %s: %s", entry.path, e)
+                continue
+            logger.info("Appended %d titles from %s", titles, entry.path)
+            appended.append(entry.name)
+        self._stats = stats
+        return appended
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='drop-folder', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except OSError as e:
+                logger.warning("Cannot read drop folder %s: %s", self.folder, e)
@@ -0,0 +1,152 @@
+# Serving several catalogs from one process
+#
+# DASHBOARD_CATALOGS names extra datasets, such as regions or snapshots,
+# next to the default one.  A page picks its catalog with ?catalog=<name>
+# (the dropdown in the header navigates there), and the callback requests of
+# that page answer from the same catalog: the name is read from the page URL
+# the browser sends as the Referer, or else from the cookie set when the
+# page was served.
+#
+# The default catalog is loaded at startup and always kept.  The others are
+# loaded on their first request, once however many requests ask for them at
+# the same time, and kept in an LRU bounded by the bytes of their prepared
+# data; the least recently used are dropped to make room.  A request still
+# answering from a dropped catalog keeps it alive until it finishes.
+import threading
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from dash import Input, Output
+from flask import has_request_context, request
+
+from catalog import Catalog
+from data import memory_report
+from lru import LRUCache
+
+DEFAULT_CATALOG = 'default'
+CATALOG_PARAM = 'catalog'
+CATALOG_COOKIE = 'dashboard_catalog'
+DEFAULT_MEMORY_MB = 2048
+
+
+def parse_catalogs(spec):
+    """``{name: path}`` of a ``name=path,name=path`` list"""
+    catalogs = {}
+    for entry in filter(None, (entry.strip() for entry in spec.split(','))):
+        name, separator, path = entry.partition('=')
+        if not separator or not name.strip() or not path.strip():
+            raise ValueError(f"Catalog {entry!r} is not of the form name=path")
+        catalogs[name.strip()] = path.strip()
+    return catalogs
+
+
+def queries_nbytes(queries):
+    """Bytes of the prepared data behind a ``FrameQueries`` or ``SummaryQueries``"""
+    nbytes = sum(value.nbytes for value in vars(queries.cube).values() if isinstance(value, np.ndarray))
+    if queries.has_rows:
+        return nbytes + sum(size for _, _, size in memory_report(queries.df, queries.countries_df, queries.indexes))
+    summaries = queries.summaries
+    for tally in (summaries.countries, summaries.genres, summaries.vote_bins):
+        nbytes += tally.nbytes() if hasattr(tally, 'nbytes') else int(
+            tally.table.memory_usage(index=False, deep=True).sum())
+    return nbytes
+
+
+def register_catalog_selector(app):
+    """Reload the page for the catalog chosen in the ``catalog-selector`` dropdown"""
+    @app.callback(Output('url', 'search'), Input('catalog-selector', 'value'), prevent_initial_call=True)
+    def select_catalog(name):
+        return f'?{CATALOG_PARAM}={name}'
+
+
+class Catalogs:
+    """The default ``Catalog`` and named catalogs loaded on first use, chosen per request
+
+    Stands in for a ``Catalog`` in the callbacks and the figure cache:
+    ``snapshot()`` and ``pinned()`` act on the catalog of the current
+    request, and ``version()`` is its (name, version), so cached figures of
+    different catalogs never mix.  Outside a request, the default catalog is
+    used.  ``load(path)`` returns the queries of a dataset.
+    """
+
+    def __init__(self, default, paths, load, max_bytes=DEFAULT_MEMORY_MB * 2 ** 20):
+        if DEFAULT_CATALOG in paths:
+            raise ValueError(f"{DEFAULT_CATALOG!r} names the catalog loaded at startup")
+        self.default = default
+        self.paths = dict(paths)
+        self.load = load
+        self.loaded = LRUCache(maxsize=max(len(self.paths), 1), max_weight=max_bytes,
+                               weigh=lambda catalog: queries_nbytes(catalog.snapshot()))
+        self.loads = 0
+        self._pinned = threading.local()
+
+    @property
+    def names(self):
+        return [DEFAULT_CATALOG] + list(self.paths)
+
+    def get(self, name):
+        """The catalog called ``name``, loading it if it is not loaded; the default for unknown names"""
+        if name not in self.paths:
+            return self.default
+        return self.loaded.get_or_compute(name, lambda: self._load(name))
+
+    def _load(self, name):
+        catalog = Catalog(self.load(self.paths[name]))
+        self.loads += 1
+        return catalog
+
+    def requested(self):
+        """Name of the catalog the current request asks for"""
+        if not has_request_context():
+            return DEFAULT_CATALOG
+        name = request.args.get(CATALOG_PARAM)
+        if name is None and request.referrer:
+            name = parse_qs(urlsplit(request.referrer).query).get(CATALOG_PARAM, [None])[0]
+        if name is None:
+            name = request.cookies.get(CATALOG_COOKIE)
+        return name if name in self.paths else DEFAULT_CATALOG
+
+    def _active(self):
+        pinned = getattr(self._pinned, 'active', None)
+        if pinned is not None:
+            return pinned
+        name = self.requested()
+        return name, self.get(name)
+
+    def snapshot(self):
+        return self._active()[1].snapshot()
+
+    def version(self):
+        name, catalog = self._active()
+        return name, catalog.version()
+
+    @contextmanager
+    def pinned(self):
+        """Make ``snapshot()`` on this thread return the same catalog's same snapshot until exit"""
+        if getattr(self._pinned, 'active', None) is not None:
+            yield self.snapshot()
+            return
+        self._pinned.active = self._active()
+        try:
+            with self._pinned.active[1].pinned() as snapshot:
+                yield snapshot
+        finally:
+            self._pinned.active = None
+
+    def register(self, server):
+        """Remember the catalog a page was served from in a cookie, for requests without a Referer"""
+        @server.after_request
+        def set_catalog_cookie(response):
+            name = request.args.get(CATALOG_PARAM)
+            if name is not None and response.mimetype == 'text/html':
+                response.set_cookie(CATALOG_COOKIE, name if name in self.paths else DEFAULT_CATALOG,
+                                    httponly=True, samesite='Lax')
+            return response
+
+    def stats(self):
+        return {
+            'loaded': [name for name, _ in self.loaded.items()],
+            'loads': self.loads,
+            'cache': self.loaded.stats(),
+        }
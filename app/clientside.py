@@ -0,0 +1,99 @@
+# Client-side filtering mode
+#
+# The server sends each session the catalog's aggregates once, through the
+# ``client-aggregates`` dcc.Store: the non-empty DataCube cells and the
+# country, genre and vote-bin tallies, as compact column lists.  The charts
+# are then rebuilt in the browser by assets/clientside.js on every control
+# change, without a request to the server.  Like streaming mode, the rating
+# violins are box plots and the ratings-vs-votes chart is a density heatmap.
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.colors import make_colorscale
+from dash import ClientsideFunction, Input, Output
+
+from lru import LRUCache
+from streaming import vote_bin_edges
+
+OUTPUTS = [
+    Output('key-metrics', 'children'),
+    Output('netflix-growth-chart', 'figure'),
+    Output('world-map-chart', 'figure'),
+    Output('genre-heatmap-chart', 'figure'),
+    Output('platform-comparison-chart', 'figure'),
+    Output('countries-bar-chart', 'figure'),
+    Output('seasonal-chart', 'figure'),
+    Output('correlation-chart', 'figure'),
+]
+
+
+def _tally_columns(tally):
+    table = tally.table
+    codes, values = table['value'].factorize()
+    return {
+        'mask': table['mask'].astype(np.int64).tolist(),
+        'year': table['year'].tolist(),
+        'bucket': table['bucket'].tolist(),
+        'value': codes.tolist(),
+        'count': table['count'].tolist(),
+        'values': values.tolist(),
+    }
+
+
+def client_aggregates(queries):
+    """Everything assets/clientside.js needs to draw the dashboard, as JSON-ready lists"""
+    summaries = queries.summaries
+    cube = summaries.cube
+    slot, year, month, bucket = np.nonzero(cube.counts)
+    cells = (slot, year, month, bucket)
+    # Second moments are kept per (mask, Year, bucket), without the month
+    moment_slot, moment_year, moment_bucket = np.nonzero(cube.counts.sum(axis=2))
+    moments = cube.moments[moment_slot, moment_year, :, moment_bucket]
+
+    vote_bins = _tally_columns(summaries.vote_bins)
+    vote_bins['labels'] = ['{:,}-{:,}'.format(*vote_bin_edges(value)) for value in vote_bins['values']]
+    return {
+        'platforms': list(queries.platforms),
+        'cells': {
+            'mask': cube.masks[slot].astype(np.int64).tolist(),
+            'year': (year + cube.year_min).tolist(),
+            'month': month.tolist(),
+            'bucket': bucket.tolist(),
+            'count': cube.counts[cells].tolist(),
+            'votes': cube.votes[cells].tolist(),
+            'rating_sum': cube.rating_sums[cells].tolist(),
+        },
+        'moments': {
+            'mask': cube.masks[moment_slot].astype(np.int64).tolist(),
+            'year': (moment_year + cube.year_min).tolist(),
+            'bucket': moment_bucket.tolist(),
+            'rating_squares': moments[:, 0].tolist(),
+            'vote_squares': moments[:, 1].tolist(),
+            'rating_votes': moments[:, 2].tolist(),
+        },
+        'countries': _tally_columns(summaries.countries),
+        'genres': _tally_columns(summaries.genres),
+        'vote_bins': vote_bins,
+        # The browser draws with the same Plotly theme as server-built figures
+        'template': go.Figure().to_plotly_json()['layout']['template'],
+        'colorscales': {
+            name: make_colorscale(getattr(px.colors.sequential, name)) for name in ('Viridis', 'Blues')
+        },
+    }
+
+
+def register_clientside_callbacks(app, catalog):
+    """Send the aggregates once per page load and draw every chart in the browser"""
+    payloads = LRUCache(2)
+
+    @app.callback(Output('client-aggregates', 'data'), Input('url', 'pathname'))
+    def load_aggregates(pathname):
+        with catalog.pinned():
+            return payloads.get_or_compute(catalog.version(), lambda: client_aggregates(catalog.snapshot()))
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='update'),
+        OUTPUTS,
+        [Input('platform-selector', 'value'), Input('year-slider', 'value'), Input('rating-slider', 'value'),
+         Input('client-aggregates', 'data')]
+    )
@@ -0,0 +1,290 @@
+# Pre-aggregated data cube for the time-series, seasonal and platform charts
+import numpy as np
+import pandas as pd
+
+from data import widen_ratings
+from timing import timed
+
+# Month slot 0 holds titles without a parsable release date
+N_MONTHS = 13
+
+# The rating slider moves in steps of 0.5, so ratings are bucketed into the
+# grid values themselves (even buckets) and the open intervals between them
+# (odd buckets).  Any slider range [low, high] on the grid is then exactly
+# buckets 4 * low .. 4 * high.
+N_RATING_BUCKETS = 41
+
+
+def rating_buckets(ratings):
+    doubled = np.asarray(ratings, dtype=np.float64) * 2
+    steps = np.floor(doubled)
+    buckets = steps * 2 + (doubled != steps)
+    return np.clip(buckets, 0, N_RATING_BUCKETS - 1).astype(np.int64)
+
+
+def bucket_values():
+    """Representative rating of each bucket: the grid value, or the middle of the interval"""
+    return np.arange(N_RATING_BUCKETS) / 4
+
+
+def bucket_range(rating_range):
+    """Bucket slice for a rating range, exact for ranges on the slider's 0.5 grid"""
+    low = max(0, int(np.ceil(rating_range[0] * 4 - 1e-9)))
+    high = min(N_RATING_BUCKETS - 1, int(np.floor(rating_range[1] * 4 + 1e-9)))
+    return low, high
+
+
+def rank_counts(counts):
+    """Series of counts per value, largest first and tied values by name
+
+    Every ranking of countries and genres goes through here, so the frame
+    and the streaming modes cut a top-N chart at the same values.
+    """
+    order = np.lexsort((counts.index.to_numpy(dtype=str), -counts.to_numpy()))
+    return counts.iloc[order]
+
+
+def pearson(n, x_sum, y_sum, x_squares, y_squares, xy_sum):
+    """Pearson correlation from sufficient statistics, NaN when undefined"""
+    covariance = n * xy_sum - x_sum * y_sum
+    spread = (n * x_squares - x_sum ** 2) * (n * y_squares - y_sum ** 2)
+    return covariance / np.sqrt(spread) if spread > 0 else np.nan
+
+
+class DataCube:
+    """Counts, vote sums and rating sums keyed by (platform mask, Year, release_month, rating bucket)
+
+    The first axis holds one slot per distinct platform combination, so a
+    title on several platforms is counted once when selecting "any of" them
+    and once per platform in the per-platform charts.  Answers cost depends on
+    the number of distinct years and buckets, not on the number of titles.
+
+    ``moments`` keeps the second-order sums of (rating, votes) per
+    (platform mask, Year, moment, rating bucket) for correlations.
+    """
+
+    MEASURES = ('counts', 'votes', 'rating_sums', 'moments')
+
+    def __init__(self, platforms):
+        self.platforms = list(platforms)
+        self.masks = np.empty(0, dtype=np.uint64)
+        self.year_min = 0
+        shape = (0, 0, N_MONTHS, N_RATING_BUCKETS)
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.votes = np.zeros(shape, dtype=np.int64)
+        self.rating_sums = np.zeros(shape, dtype=np.float64)
+        # rating squared, votes squared, rating times votes
+        self.moments = np.zeros((0, 0, 3, N_RATING_BUCKETS), dtype=np.float64)
+
+    @classmethod
+    def from_frame(cls, df, platforms):
+        cube = cls(platforms)
+        cube.add(df)
+        return cube
+
+    @property
+    def years(self):
+        return np.arange(self.year_min, self.year_min + self.counts.shape[1])
+
+    def add(self, df):
+        """Add the titles of ``df`` to the cube, growing it for new platform combinations or years"""
+        # Ratings are served as float32; summed as parsed, so averages show no float32 noise
+        ratings = widen_ratings(df['vote_average'].to_numpy(dtype=np.float64))
+        years = df['Year'].to_numpy(dtype=np.float64)
+        # Titles without a rating or year never pass the slider filters
+        keep = ~np.isnan(ratings) & ~np.isnan(years)
+        if not keep.any():
+            return
+        ratings = ratings[keep]
+        years = years[keep].astype(np.int64)
+        masks = df['platform_mask'].to_numpy().astype(np.uint64)[keep]
+        months = np.nan_to_num(df['release_month'].to_numpy(dtype=np.float64)[keep]).astype(np.int64)
+        votes = np.nan_to_num(df['vote_count'].to_numpy(dtype=np.float64)[keep]).astype(np.int64)
+
+        self._grow(np.unique(masks), years.min(), years.max())
+        slots = np.searchsorted(self.masks, masks)
+        buckets = rating_buckets(ratings)
+        flat = np.ravel_multi_index((slots, years - self.year_min, months, buckets), self.counts.shape)
+        # Only the cells the titles fall into are written, so a small batch
+        # costs O(batch) however large the cube is
+        cells, inverse = np.unique(flat, return_inverse=True)
+        self.counts.reshape(-1)[cells] += np.bincount(inverse)
+        self.votes.reshape(-1)[cells] += np.bincount(inverse, weights=votes).astype(np.int64)
+        self.rating_sums.reshape(-1)[cells] += np.bincount(inverse, weights=ratings)
+
+        votes = votes.astype(np.float64)
+        for moment, weights in enumerate((ratings ** 2, votes ** 2, ratings * votes)):
+            flat = np.ravel_multi_index((slots, years - self.year_min, np.full(len(slots), moment), buckets),
+                                        self.moments.shape)
+            cells, inverse = np.unique(flat, return_inverse=True)
+            self.moments.reshape(-1)[cells] += np.bincount(inverse, weights=weights)
+
+    def copy(self):
+        cube = DataCube(self.platforms)
+        cube.masks = self.masks.copy()
+        cube.year_min = self.year_min
+        for name in self.MEASURES:
+            setattr(cube, name, getattr(self, name).copy())
+        return cube
+
+    def _grow(self, masks, year_min, year_max):
+        n_years = self.counts.shape[1]
+        if n_years:
+            year_min = min(year_min, self.year_min)
+            year_max = max(year_max, self.year_min + n_years - 1)
+        all_masks = np.union1d(self.masks, masks)
+        if len(all_masks) == len(self.masks) and year_min == self.year_min and year_max - year_min + 1 == n_years:
+            return
+
+        slots = np.searchsorted(all_masks, self.masks)
+        offset = self.year_min - year_min
+        for name in self.MEASURES:
+            old = getattr(self, name)
+            new = np.zeros((len(all_masks), year_max - year_min + 1) + old.shape[2:], dtype=old.dtype)
+            new[slots, offset:offset + n_years] = old
+            setattr(self, name, new)
+        self.masks = all_masks
+        self.year_min = year_min
+
+    def _slice(self, measure, year_range, rating_range):
+        """``measure`` restricted to the slider ranges, as (mask, year, month or moment, bucket)"""
+        start = max(0, int(np.ceil(year_range[0])) - self.year_min)
+        stop = min(measure.shape[1], int(np.floor(year_range[1])) - self.year_min + 1)
+        low, high = bucket_range(rating_range)
+        return measure[:, start:max(start, stop), :, low:max(low, high + 1)], self.year_min + start
+
+    def _membership(self, selected_platforms):
+        """(platform, mask slot) matrix of ones where the slot includes the platform"""
+        bits = np.array([self.platforms.index(platform) for platform in selected_platforms], dtype=np.uint64)
+        return ((self.masks[None, :] >> bits[:, None]) & np.uint64(1)).astype(np.int64)
+
+    def _any_of(self, selected_platforms):
+        """Mask slots including at least one of the selected platforms"""
+        return self._membership(selected_platforms).any(axis=0)
+
+    @timed('aggregate')
+    def selection_stats(self, selected_platforms, year_range, rating_range):
+        """Sufficient statistics of (rating, votes) over titles on any selected platform
+
+        Returns ``(n, rating_sum, vote_sum, rating_squares, vote_squares, rating_votes)``.
+        """
+        slots = self._any_of(selected_platforms)
+        n, votes, ratings = (
+            self._slice(measure, year_range, rating_range)[0][slots].sum()
+            for measure in (self.counts, self.votes, self.rating_sums)
+        )
+        moments = self._slice(self.moments, year_range, rating_range)[0][slots].sum(axis=(0, 1, 3))
+        return (n, ratings, votes) + tuple(moments)
+
+    @timed('aggregate')
+    def platform_rating_histograms(self, selected_platforms, year_range, rating_range):
+        """(platform, rating bucket) matrix of title counts over all buckets"""
+        counts, _ = self._slice(self.counts, year_range, (0, 10))
+        histograms = self._membership(selected_platforms) @ counts.sum(axis=(1, 2))
+        low, high = bucket_range(rating_range)
+        histograms[:, :low] = 0
+        histograms[:, high + 1:] = 0
+        return histograms
+
+    @timed('aggregate')
+    def platform_year_counts(self, selected_platforms, year_range, rating_range):
+        """Years in range and a (platform, year) matrix of title counts"""
+        counts, first_year = self._slice(self.counts, year_range, rating_range)
+        by_year = self._membership(selected_platforms) @ counts.sum(axis=(2, 3))
+        return np.arange(first_year, first_year + by_year.shape[1]), by_year
+
+    @timed('aggregate')
+    def platform_month_counts(self, selected_platforms, year_range, rating_range):
+        """(platform, month) matrix of title counts, month 0 being unknown"""
+        counts, _ = self._slice(self.counts, year_range, rating_range)
+        return self._membership(selected_platforms) @ counts.sum(axis=(1, 3))
+
+    @timed('aggregate')
+    def platform_totals(self, selected_platforms, year_range, rating_range):
+        """Per-platform title counts, vote sums and rating sums"""
+        membership = self._membership(selected_platforms)
+        return tuple(
+            membership @ self._slice(measure, year_range, rating_range)[0].sum(axis=(1, 2, 3))
+            for measure in (self.counts, self.votes, self.rating_sums)
+        )
+
+
+class Tally:
+    """Counts keyed by (platform mask, Year, rating bucket, value), stored sparsely
+
+    Used for dimensions too wide for the dense cube, such as countries or
+    genres.  Its size depends on the number of distinct keys, not on the
+    number of titles added.  Chunks are grouped on arrival and merged into
+    the table once enough of them are pending.
+    """
+
+    KEYS = ['mask', 'year', 'bucket', 'value']
+
+    def __init__(self, compact_every=500_000):
+        self.compact_every = compact_every
+        self._table = pd.DataFrame({
+            'mask': pd.Series(dtype=np.uint64),
+            'year': pd.Series(dtype=np.int64),
+            'bucket': pd.Series(dtype=np.int64),
+            'value': pd.Series(dtype=object),
+            'count': pd.Series(dtype=np.int64),
+        })
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, masks, years, ratings, values, counts=None):
+        part = pd.DataFrame({
+            'mask': np.asarray(masks).astype(np.uint64),
+            'year': np.asarray(years, dtype=np.float64),
+            'ratings': np.asarray(ratings, dtype=np.float64),
+            'value': values,
+            'count': 1 if counts is None else counts,
+        }).dropna()
+        if len(part) == 0:
+            return
+        part['year'] = part['year'].astype(np.int64)
+        part['bucket'] = rating_buckets(part.pop('ratings'))
+        part = part.groupby(self.KEYS, sort=False)['count'].sum().reset_index()
+        self._pending.append(part)
+        self._pending_rows += len(part)
+        if self._pending_rows >= self.compact_every:
+            self.compact()
+
+    def copy(self):
+        tally = Tally(self.compact_every)
+        # compact() replaces the table rather than changing it, so it can be shared
+        tally._table = self._table
+        tally._pending = list(self._pending)
+        tally._pending_rows = self._pending_rows
+        return tally
+
+    def compact(self):
+        if not self._pending:
+            return
+        combined = pd.concat([self._table] + self._pending, ignore_index=True)
+        self._table = combined.groupby(self.KEYS, sort=False)['count'].sum().reset_index()
+        self._pending = []
+        self._pending_rows = 0
+
+    @property
+    def table(self):
+        self.compact()
+        return self._table
+
+    def select(self, bits, year_range, rating_range):
+        """Table entries on any platform in ``bits`` inside the slider ranges"""
+        table = self.table
+        low, high = bucket_range(rating_range)
+        years = table['year'].to_numpy()
+        buckets = table['bucket'].to_numpy()
+        keep = (
+            ((table['mask'].to_numpy() & np.uint64(bits)) != 0) &
+            (years >= year_range[0]) & (years <= year_range[1]) &
+            (buckets >= low) & (buckets <= high)
+        )
+        return table[keep]
+
+    def counts(self, bits, year_range, rating_range):
+        """Counts per value over entries on any platform in ``bits``, ranked by ``rank_counts``"""
+        counts = self.select(bits, year_range, rating_range).groupby('value', sort=False)['count'].sum()
+        return rank_counts(counts)
@@ -0,0 +1,306 @@
+# Data loading
+import json
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from cache import cache_path, read_cache, write_cache
+from indexes import IncidenceIndex, TitleIndexes, gather_rows
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(BASE_DIR, 'datasets', 'cleaned', 'movies_cleaned.csv')
+CACHE_DIR = os.path.join(BASE_DIR, 'datasets', 'cache')
+PLATFORMS = ['Netflix', 'Hulu', 'Prime Video', 'Disney+']
+
+# Below this many rows per process, decoding inline beats starting a pool
+MIN_ROWS_PER_WORKER = 20_000
+
+
+def _loads_or_empty(value):
+    try:
+        entries = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return entries if isinstance(entries, list) else []
+
+
+def _row_entries(entries, key):
+    try:
+        return [(entry[key], entry['name']) for entry in entries]
+    except (TypeError, KeyError):
+        return []
+
+
+def parse_json_column(series, key):
+    """Decode a column of JSON arrays such as ``production_countries``.
+
+    The whole column is decoded with a single ``json.loads`` call; rows that
+    are missing or malformed decode to an empty list, like the old per-row
+    helpers did.  Returns ``(lengths, codes, names)`` where ``lengths`` holds
+    the number of entries per row and ``codes``/``names`` are the flattened
+    ``key`` and ``name`` fields in row order.
+    """
+    values = series.where(series.notna(), '[]').astype(str)
+    try:
+        rows = json.loads('[' + ','.join(values) + ']')
+    except ValueError:
+        # A malformed row poisons the bulk decode, fall back to row by row
+        rows = [_loads_or_empty(value) for value in values]
+
+    pairs = [_row_entries(entries, key) if isinstance(entries, list) else [] for entries in rows]
+    lengths = np.fromiter((len(row) for row in pairs), dtype=np.int64, count=len(pairs))
+    codes = [code for row in pairs for code, _ in row]
+    names = [name for row in pairs for _, name in row]
+    return lengths, codes, names
+
+
+# A decoded JSON column: row i holds the entries codes[offsets[i]:offsets[i + 1]],
+# each indexing the distinct (key, name) pairs keys[code], names[code]
+DecodedColumn = namedtuple('DecodedColumn', ['offsets', 'codes', 'keys', 'names'])
+
+
+def _intern_chunk(values, key):
+    """Decode one chunk of a JSON column, numbering its distinct (key, name) pairs
+
+    Catalogs repeat the same country and language lists over and over, so
+    only the distinct JSON strings are decoded and their entries are then
+    gathered for every row.
+    """
+    row_codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna('[]'))
+    unique_lengths, keys, names = parse_json_column(pd.Series(uniques, dtype=object), key)
+    vocabulary = {}
+    unique_codes = np.fromiter((vocabulary.setdefault(pair, len(vocabulary)) for pair in zip(keys, names)),
+                               dtype=np.int32, count=len(keys))
+    positions, lengths = gather_rows(np.concatenate(([0], np.cumsum(unique_lengths))), row_codes)
+    return lengths, unique_codes[positions], list(vocabulary)
+
+
+def parse_workers(n_rows, workers=None):
+    """Processes to decode ``n_rows`` rows with, one per core unless ``workers`` is given"""
+    if workers is None:
+        workers = min(os.cpu_count() or 1, n_rows // MIN_ROWS_PER_WORKER)
+    return max(1, workers)
+
+
+def decode_json_columns(columns, workers=None):
+    """Decode JSON array columns such as ``production_countries`` in parallel
+
+    ``columns`` is a list of ``(series, key)``.  Every column is split into one
+    contiguous chunk per worker, the chunks are decoded in a process pool
+    (inline with a single worker), and repeated ``(key, name)`` pairs are
+    interned, so each column comes back as a ``DecodedColumn`` of int32 codes
+    and per-row offsets rather than lists of strings.
+    """
+    workers = parse_workers(max((len(series) for series, _ in columns), default=0), workers)
+    tasks = [
+        (column, chunk, key)
+        for column, (series, key) in enumerate(columns)
+        for chunk in np.array_split(series.to_numpy(dtype=object), workers)
+    ]
+    if workers == 1:
+        results = [_intern_chunk(chunk, key) for _, chunk, key in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_intern_chunk, [chunk for _, chunk, _ in tasks], [key for _, _, key in tasks]))
+
+    decoded = []
+    for column in range(len(columns)):
+        vocabulary = {}
+        lengths, codes = [], []
+        for (task_column, _, _), (chunk_lengths, chunk_codes, pairs) in zip(tasks, results):
+            if task_column == column:
+                remap = np.fromiter((vocabulary.setdefault(pair, len(vocabulary)) for pair in pairs),
+                                    dtype=np.int32, count=len(pairs))
+                lengths.append(chunk_lengths)
+                codes.append(remap[chunk_codes])
+        decoded.append(DecodedColumn(
+            offsets=np.concatenate(([0], np.cumsum(np.concatenate(lengths)))).astype(np.int64),
+            codes=np.concatenate(codes),
+            keys=np.array([key for key, _ in vocabulary], dtype=object),
+            names=np.array([name for _, name in vocabulary], dtype=object),
+        ))
+    return decoded
+
+
+def name_index(column):
+    """Title x name ``IncidenceIndex`` of a decoded column, pairs sharing a name merged"""
+    name_codes, names = pd.factorize(column.names)
+    return IncidenceIndex.from_arrays(column.offsets, name_codes[column.codes].astype(np.int32),
+                                      np.asarray(names, dtype=str))
+
+
+def mask_dtype(n_platforms):
+    """Smallest unsigned integer type with one bit per platform"""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_platforms <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"Cannot pack {n_platforms} platforms into a 64-bit mask")
+
+
+def encode_platforms(df, platforms):
+    """Pack the 0/1 platform columns into one bitmask, bit i set for ``platforms[i]``"""
+    dtype = mask_dtype(len(platforms))
+    mask = np.zeros(len(df), dtype=dtype)
+    for bit, platform in enumerate(platforms):
+        mask |= (df[platform].to_numpy() > 0).astype(dtype) << dtype(bit)
+    return mask
+
+
+# CSV columns the serving frames are built from, besides the platform columns
+SOURCE_COLUMNS = ['Year', 'vote_average', 'vote_count', 'genres', 'release_date',
+                  'production_countries', 'spoken_languages']
+
+# Types of the serving frame's columns, besides the platform bitmask.  Ratings
+# are kept as float32, which holds TMDB's one-decimal ratings and the slider's
+# half-point bounds exactly enough for every range check.
+SERVING_TYPES = {
+    'Year': np.int16,
+    'vote_average': np.float32,
+    'vote_count': np.int32,
+    'release_month': np.uint8,
+    'genres': 'category',
+}
+
+
+def dictionary_column(codes, values):
+    """Categorical of ``values[codes]``, built without materializing the strings per row"""
+    value_codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return pd.Categorical.from_codes(value_codes[codes], uniques)
+
+
+def prepare_titles(df, platforms, first_row=0, workers=None):
+    """Prepare raw CSV rows into the title frame, the title/country pairs and the incidence indexes
+
+    The title frame holds only what the dashboard reads, in the compact types
+    of ``SERVING_TYPES``, plus ``platform_mask`` with one bit per platform in
+    place of the platform columns.  Release months are 1 to 12, 0 when the
+    release date is unknown.
+
+    ``first_row`` is the frame position of its first title, so a batch can be
+    prepared on its own and appended to an existing frame.  The third value
+    maps ``countries`` and ``languages`` to ``IncidenceIndex`` objects over
+    the rows of ``df``.  ``workers`` is the number of processes decoding the
+    JSON columns.
+    """
+    if df['Year'].isna().any():
+        raise ValueError("Titles without a Year cannot be served")
+    release_dates = pd.to_datetime(df['release_date'], errors='coerce')
+    titles = pd.DataFrame({
+        'Year': df['Year'].to_numpy(),
+        'vote_average': df['vote_average'].to_numpy(),
+        'vote_count': df['vote_count'].fillna(0).to_numpy(),
+        'release_month': release_dates.dt.month.fillna(0).to_numpy(),
+        'genres': df['genres'].to_numpy(),
+    }).astype(SERVING_TYPES)
+    titles['platform_mask'] = encode_platforms(df, platforms)
+
+    countries, languages = decode_json_columns(
+        [(df['production_countries'], 'iso_3166_1'), (df['spoken_languages'], 'iso_639_1')], workers
+    )
+    countries_df = pd.DataFrame({
+        'row': np.repeat(np.arange(first_row, first_row + len(df), dtype=np.int32), np.diff(countries.offsets)),
+        'iso_3166_1': dictionary_column(countries.codes, countries.keys),
+        'country': dictionary_column(countries.codes, countries.names),
+    })
+    incidences = {'countries': name_index(countries), 'languages': name_index(languages)}
+
+    return titles, countries_df, incidences
+
+
+def prepare_frames(data_path, platforms, workers=None):
+    """Parse the cleaned CSV into the title frame, the title/country pairs and the incidence indexes"""
+    df = pd.read_csv(data_path, usecols=lambda column: column in SOURCE_COLUMNS or column in platforms)
+    return prepare_titles(df, platforms, workers=workers)
+
+
+def concat_frames(frames):
+    """Frames stacked row-wise, categorical columns staying categorical over the union of their values"""
+    df = pd.concat(frames, ignore_index=True)
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            df[column] = union_categoricals([frame[column] for frame in frames])
+    return df
+
+
+def widen_ratings(ratings):
+    """float32 ratings as float64 for charts, rounded back to the decimals they were parsed from
+
+    float32 keeps 7 significant digits, so below 10 rounding to 6 decimals
+    gives the CSV's value again instead of e.g. 6.099999904632568.
+    """
+    return np.round(np.asarray(ratings, dtype=np.float64), 6)
+
+
+def memory_report(df, countries_df, indexes):
+    """``(name, dtype, bytes)`` of every serving column and index array, largest first
+
+    Memory-mapped columns count in full, though gunicorn workers share them.
+    """
+    report = [(f'titles.{column}', str(df[column].dtype), int(df[column].memory_usage(index=False, deep=True)))
+              for column in df.columns]
+    report += [(f'countries.{column}', str(countries_df[column].dtype),
+                int(countries_df[column].memory_usage(index=False, deep=True))) for column in countries_df.columns]
+    report += [(f'indexes.{name}', str(values.dtype), int(values.nbytes)) for name, values in indexes.arrays().items()]
+    return sorted(report, key=lambda entry: -entry[2])
+
+
+def log_memory_report(df, countries_df, indexes):
+    report = memory_report(df, countries_df, indexes)
+    logger.info("Serving %d titles in %.1f MB:", len(df), sum(size for _, _, size in report) / 2 ** 20)
+    for name, dtype, size in report:
+        logger.info("  %-28s %-10s %10.1f KB", name, dtype, size / 2 ** 10)
+
+
+def load_data(data_path=DATA_PATH, platforms=PLATFORMS, cache_dir=CACHE_DIR, shared=False, workers=None):
+    """Load and prepare the data
+
+    Returns the title frame in the serving schema of ``prepare_titles``, a
+    slim long table of title/country pairs with the columns ``row`` (position
+    of the title in the frame), ``iso_3166_1`` and ``country``, and the
+    indexes used by the filter engine.
+
+    The prepared frames are cached in ``cache_dir`` keyed by the source
+    file's content hash, so warm starts skip CSV and JSON parsing.  Pass
+    ``cache_dir=None`` to always parse.
+
+    With ``shared=True`` the numeric columns and index arrays are
+    memory-mapped read-only from the cache instead of read into the process,
+    so every gunicorn worker attaches to the same pages.
+
+    ``workers`` sets how many processes decode the JSON columns on a cache
+    miss, by default one per core for large catalogs.
+    """
+    mmap_mode = 'r' if shared else None
+    cached = None
+    if cache_dir is not None:
+        try:
+            path = cache_path(data_path, cache_dir, platforms)
+            cached = read_cache(path, mmap_mode)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable data cache: %s", e)
+            cache_dir = None
+
+    if cached is not None:
+        df, countries_df, index_arrays = cached
+        return df, countries_df, TitleIndexes(df, platforms, index_arrays)
+
+    df, countries_df, incidences = prepare_frames(data_path, platforms, workers)
+    indexes = TitleIndexes(df, platforms, incidences=incidences)
+    if cache_dir is not None:
+        try:
+            write_cache(path, df, countries_df, indexes.arrays())
+        except OSError as e:
+            logger.warning("Could not write data cache %s: %s", path, e)
+        else:
+            if shared:
+                # Drop the private copy and attach to the entry just written
+                df, countries_df, index_arrays = read_cache(path, mmap_mode)
+                indexes = TitleIndexes(df, platforms, index_arrays)
+    return df, countries_df, indexes
@@ -0,0 +1,245 @@
+# ETL pipeline producing the cleaned catalog
+#
+# Does what notebooks/data_cleaning.ipynb did by hand, as a rerunnable
+# chunked pipeline:
+#
+#   partition  stream both raw CSVs in chunks and hash every row by title
+#              into one staging file per partition and side
+#   join       inner-join each partition's two sides on title, in a process
+#              pool, and store the result in the binary columnar format of
+#              cache.py
+#   assemble   median-fill budget_filled over all partitions and write the
+#              cleaned CSV the dashboard serves, in the notebook's row order
+#
+# A rerun skips partitioning when neither raw file changed, and rejoins only
+# the partitions whose staging files differ from the last run.
+#
+#   python app/etl.py [--movies datasets/raw/movies.csv] [--tmdb datasets/raw/movie_dataset.csv]
+#                     [--partitions 16] [--workers N] [--output datasets/cleaned/movies_cleaned.csv]
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from cache import file_sha256, load_frame, save_frame, source_fingerprint
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, 'datasets', 'raw')
+MOVIES_PATH = os.path.join(RAW_DIR, 'movies.csv')
+TMDB_PATH = os.path.join(RAW_DIR, 'movie_dataset.csv')
+OUTPUT_PATH = os.path.join(BASE_DIR, 'datasets', 'cleaned', 'movies_cleaned.csv')
+WORK_DIR = os.path.join(BASE_DIR, 'datasets', 'etl')
+
+DEFAULT_PARTITIONS = 16
+DEFAULT_CHUNK_ROWS = 100_000
+MANIFEST_VERSION = 1
+
+# Columns the notebook dropped from each side before or after the join
+MOVIES_DROP = ['Unnamed: 0', 'ID', 'Type']
+TMDB_DROP = [
+    'original_title', 'original_language', 'production_companies', 'cast', 'crew',
+    'director', 'homepage', 'status', 'tagline', 'keywords', 'index',
+]
+
+# Types of the numeric output columns, so every partition stores the same ones
+SCHEMA = {
+    'Year': np.int64,
+    'Age': np.int64,
+    'Netflix': np.int64,
+    'Hulu': np.int64,
+    'Prime Video': np.int64,
+    'Disney+': np.int64,
+    'budget': np.int64,
+    'id': np.int64,
+    'popularity': np.float64,
+    'revenue': np.int64,
+    'runtime': np.float64,
+    'vote_average': np.float64,
+    'vote_count': np.int64,
+}
+
+# Original file positions, kept through the join to restore the notebook's row order
+MOVIES_ROW = '_movies_row'
+TMDB_ROW = '_tmdb_row'
+
+
+def title_partitions(titles, n_partitions):
+    """Partition of each title, stable across runs and processes"""
+    hashes = pd.util.hash_pandas_object(pd.Series(titles, dtype=object).fillna(''), index=False)
+    return (hashes.to_numpy() % np.uint64(n_partitions)).astype(np.int64)
+
+
+def staging_path(work_dir, side, partition):
+    return os.path.join(work_dir, 'staging', side, f'{partition:04d}.csv')
+
+
+def partition_file(path, side, key, work_dir, n_partitions, chunk_rows):
+    """Stream ``path`` in chunks into one staging CSV per partition of its ``key`` column
+
+    Each row keeps its position in the file in an extra column.
+    """
+    directory = os.path.dirname(staging_path(work_dir, side, 0))
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    row_column = MOVIES_ROW if side == 'movies' else TMDB_ROW
+    written = set()
+    first_row = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+        chunk[row_column] = np.arange(first_row, first_row + len(chunk))
+        first_row += len(chunk)
+        for partition, rows in chunk.groupby(title_partitions(chunk[key], n_partitions), sort=False):
+            rows.to_csv(staging_path(work_dir, side, partition), mode='a', header=partition not in written,
+                        index=False)
+            written.add(partition)
+    # Empty partitions still get a file, so every partition has both sides
+    header = ','.join(pd.read_csv(path, nrows=0).columns.tolist() + [row_column]) + '\n'
+    for partition in range(n_partitions):
+        if partition not in written:
+            with open(staging_path(work_dir, side, partition), 'w') as f:
+                f.write(header)
+    return first_row
+
+
+def read_staging(path):
+    # Strings exactly as in the raw file, empty fields being missing values
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+
+
+def apply_schema(df):
+    for column, dtype in SCHEMA.items():
+        values = pd.to_numeric(df[column], errors='raise')
+        if np.issubdtype(dtype, np.integer) and values.isna().any():
+            raise ValueError(f"Column {column} has missing values but is typed {np.dtype(dtype).name}")
+        df[column] = values.astype(dtype)
+    return df
+
+
+def join_partition(work_dir, partition, current_year):
+    """Clean and join one partition's two sides, stored as a binary frame under ``joined/``"""
+    movies = read_staging(staging_path(work_dir, 'movies', partition))
+    tmdb = read_staging(staging_path(work_dir, 'tmdb', partition))
+
+    movies['Age'] = current_year - pd.to_numeric(movies['Year'])
+    movies = movies.dropna(subset=['Rotten Tomatoes']).drop(columns=MOVIES_DROP)
+    tmdb = tmdb.drop(columns=TMDB_DROP)
+    joined = movies.merge(tmdb, left_on='Title', right_on='title', how='inner')
+    joined[[MOVIES_ROW, TMDB_ROW]] = joined[[MOVIES_ROW, TMDB_ROW]].astype(np.int64)
+    joined = apply_schema(joined)
+
+    directory = os.path.join(work_dir, 'joined', f'{partition:04d}')
+    shutil.rmtree(directory, ignore_errors=True)
+    save_frame(joined, directory)
+    return partition, len(joined)
+
+
+def assemble(work_dir, n_partitions):
+    """All joined partitions in the notebook's row order, with ``budget_filled``"""
+    frames = [load_frame(os.path.join(work_dir, 'joined', f'{partition:04d}')) for partition in range(n_partitions)]
+    df = pd.concat(frames, ignore_index=True).sort_values([MOVIES_ROW, TMDB_ROW], kind='stable')
+    df = df.drop(columns=[MOVIES_ROW, TMDB_ROW]).reset_index(drop=True)
+
+    # A budget of 0 means unknown, filled with the median of the known budgets
+    median_budget = df.loc[df['budget'] > 0, 'budget'].median()
+    budget_filled = df['budget'].where(df['budget'] != 0, median_budget)
+    df['budget_filled'] = budget_filled.astype(np.int64) if float(median_budget).is_integer() else budget_filled
+    return df
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def _write_manifest(path, manifest):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def run(movies_path=MOVIES_PATH, tmdb_path=TMDB_PATH, output_path=OUTPUT_PATH, work_dir=WORK_DIR,
+        n_partitions=DEFAULT_PARTITIONS, workers=None, chunk_rows=DEFAULT_CHUNK_ROWS, current_year=None):
+    """Run the pipeline, reprocessing only what changed since the last run in ``work_dir``
+
+    Returns the number of partitions joined in this run.
+    """
+    current_year = current_year or date.today().year
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, 'manifest.json')
+    previous = _read_manifest(manifest_path) or {}
+    settings = {'partitions': n_partitions, 'current_year': current_year}
+    if previous.get('settings') != settings:
+        previous = {}
+
+    sources = {'movies': source_fingerprint(movies_path, work_dir), 'tmdb': source_fingerprint(tmdb_path, work_dir)}
+    if previous.get('sources') == sources:
+        logger.info("Raw files unchanged, reusing the staging partitions")
+    else:
+        start = time.perf_counter()
+        partition_file(movies_path, 'movies', 'Title', work_dir, n_partitions, chunk_rows)
+        partition_file(tmdb_path, 'tmdb', 'title', work_dir, n_partitions, chunk_rows)
+        logger.info("Partitioned the raw files in %.1f s", time.perf_counter() - start)
+
+    partitions = {}
+    for partition in range(n_partitions):
+        digest = hashlib.sha256()
+        for side in ('movies', 'tmdb'):
+            digest.update(file_sha256(staging_path(work_dir, side, partition)).encode())
+        partitions[str(partition)] = digest.hexdigest()
+
+    done = previous.get('partitions', {})
+    stale = [
+        partition for partition in range(n_partitions)
+        if done.get(str(partition)) != partitions[str(partition)]
+        or not os.path.isdir(os.path.join(work_dir, 'joined', f'{partition:04d}'))
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(join_partition, work_dir, partition, current_year) for partition in stale]
+        for future in futures:
+            future.result()
+    logger.info("Joined %d of %d partitions in %.1f s", len(stale), n_partitions, time.perf_counter() - start)
+
+    df = assemble(work_dir, n_partitions)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    df.to_csv(output_path + '.tmp', index=False)
+    os.replace(output_path + '.tmp', output_path)
+    _write_manifest(manifest_path, {
+        'version': MANIFEST_VERSION, 'settings': settings, 'sources': sources, 'partitions': partitions,
+    })
+    logger.info("Wrote %d titles to %s", len(df), output_path)
+    return len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the cleaned catalog from the raw CSVs")
+    parser.add_argument('--movies', default=MOVIES_PATH, help="streaming availability CSV")
+    parser.add_argument('--tmdb', default=TMDB_PATH, help="TMDB movie metadata CSV")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="cleaned CSV to write")
+    parser.add_argument('--work-dir', default=WORK_DIR, help="staging partitions, joined frames and manifest")
+    parser.add_argument('--partitions', type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument('--workers', type=int, default=None, help="join processes (default: one per core)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--year', type=int, default=None, help="year Age is computed from (default: this year)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    run(args.movies, args.tmdb, args.output, args.work_dir, args.partitions, args.workers, args.chunk_rows,
+        args.year)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Server-side cache of the serialized chart figures
+#
+# Every user sends the same three controls, so a chart for a given filter
+# state only needs to be built once.  Figures are stored as the JSON Plotly
+# serializes them to, keyed by chart, catalog version and normalized filter
+# state, and repeat requests skip both the queries and the figure building.
+# Requests for a figure that another request is building wait for it rather
+# than build it again.
+import functools
+import json
+
+from filters import normalize_filter
+from latest import checkpoint
+from lru import LRUCache
+from timing import stage
+
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL = 600
+
+
+def clamp_range(value_range, low, high):
+    """``value_range`` cut to ``[low, high]``, or unchanged if it lies outside entirely"""
+    start, end = max(value_range[0], low), min(value_range[1], high)
+    return (start, end) if start <= end else tuple(value_range)
+
+
+class FigureCache:
+    """LRU cache with TTL of figure JSON in front of the chart callbacks
+
+    Filter states are normalized before lookup: platforms in dashboard order
+    and both ranges clamped to their slider bounds.  Callbacks are run with
+    the normalized state, so every request sharing a key gets the same
+    figure.  The catalog version (batches appended) is part of the key, so
+    appended titles show up in the next request.  ``catalog`` may be a
+    catalogs.Catalogs, with ``year_bounds`` a function returning the bounds
+    of the catalog the request answers from.
+
+    With an ``access_log`` (see warmer.py) every requested state is logged,
+    so the next start can warm the popular ones.  With a ``budget`` (a
+    payload.FigureBudget) figures are slimmed before they are stored.
+    """
+
+    def __init__(self, catalog, platforms, year_bounds, rating_bounds=(0, 10),
+                 maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, access_log=None, budget=None):
+        self.catalog = catalog
+        self.platforms = platforms
+        self.year_bounds = year_bounds
+        self.rating_bounds = rating_bounds
+        self.cache = LRUCache(maxsize, ttl)
+        self.access_log = access_log
+        self.budget = budget
+        # chart -> figure callback, as registered with cached()
+        self.callbacks = {}
+
+    def normalize(self, selected_platforms, year_range, rating_range):
+        platforms, year_range, rating_range = normalize_filter(
+            selected_platforms, year_range, rating_range, self.platforms
+        )
+        year_bounds = self.year_bounds() if callable(self.year_bounds) else self.year_bounds
+        return (
+            platforms,
+            clamp_range(year_range, *year_bounds),
+            clamp_range(rating_range, *self.rating_bounds),
+        )
+
+    def cached(self, chart):
+        """Decorator caching a ``(selected_platforms, year_range, rating_range)`` figure callback"""
+        def decorator(callback):
+            self.callbacks[chart] = callback
+
+            @functools.wraps(callback)
+            def wrapper(selected_platforms, year_range, rating_range):
+                state = self.normalize(selected_platforms, year_range, rating_range)
+                if self.access_log is not None and state[0]:
+                    self.access_log.record(state)
+                checkpoint()
+                figure_json = self._get(chart, callback, state, interrupt=checkpoint)
+                checkpoint()
+                with stage('serialize'):
+                    return json.loads(figure_json)
+            return wrapper
+        return decorator
+
+    def warm(self, chart, selected_platforms, year_range, rating_range):
+        """Build and cache ``chart`` for a filter state, unless it is cached already"""
+        self._get(chart, self.callbacks[chart], self.normalize(selected_platforms, year_range, rating_range))
+
+    def _get(self, chart, callback, state, interrupt=None):
+        # Pinned, so the figure is built from the version it is stored under
+        with self.catalog.pinned():
+            key = (chart, self.catalog.version(), state)
+            return self.cache.get_or_compute(key, lambda: self._build(callback, state), interrupt=interrupt)
+
+    def _build(self, callback, state):
+        figure = callback(*(list(value) for value in state))
+        with stage('serialize'):
+            return figure.to_json() if self.budget is None else self.budget.to_json(figure)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,157 @@
+# Shared filter engine for the dashboard callbacks
+import numpy as np
+import pandas as pd
+
+from cube import rank_counts
+from lru import LRUCache
+from timing import add_rows, stage, timed
+
+
+def normalize_filter(selected_platforms, year_range, rating_range, platforms):
+    """Canonical, hashable form of the three dashboard controls
+
+    Platforms are put in dashboard order so that ``['Hulu', 'Netflix']`` and
+    ``['Netflix', 'Hulu']`` share a key.
+    """
+    selected = set(selected_platforms or ())
+    return (
+        tuple(platform for platform in platforms if platform in selected),
+        (year_range[0], year_range[1]),
+        (float(rating_range[0]), float(rating_range[1])),
+    )
+
+
+def indexed_rows(indexes, selected_platforms, year_range, rating_range):
+    """Sorted positions of the matching titles, using the precomputed range indexes"""
+    if not selected_platforms:
+        return np.empty(0, dtype=np.int64)
+
+    rows = indexes.range_rows(year_range, rating_range)
+    bits = indexes.platform_bits(selected_platforms)
+    return rows[(indexes.platform_mask[rows] & bits) != 0]
+
+
+def batch_rows(indexes, first_row, selected_platforms, year_range, rating_range):
+    """Positions from ``first_row`` on matching the filter, checked row by row"""
+    if not selected_platforms:
+        return np.empty(0, dtype=np.int64)
+
+    years = indexes.year_values[first_row:]
+    ratings = indexes.rating_values[first_row:]
+    keep = (
+        ((indexes.platform_mask[first_row:] & indexes.platform_bits(selected_platforms)) != 0) &
+        (years >= year_range[0]) & (years <= year_range[1]) &
+        (ratings >= rating_range[0]) & (ratings <= rating_range[1])
+    )
+    return np.flatnonzero(keep) + first_row
+
+
+class FilterResult:
+    """Rows matching one filter state, with what is derived from them built on first use
+
+    Every chart asking for the same filter state shares one result, so the
+    filtered frame, the per-platform subsets and the country counts are each
+    computed once however many charts use them.
+    """
+
+    def __init__(self, engine, rows):
+        self.engine = engine
+        self.rows = rows
+        self._titles = None
+        self._countries = None
+        self._country_counts = None
+        self._platform_rows = {}
+
+    @property
+    def titles(self):
+        if self._titles is None:
+            with stage('filter'):
+                self._titles = self.engine.df.iloc[self.rows]
+        return self._titles
+
+    @property
+    def countries(self):
+        if self._countries is None:
+            # countries_df only holds (row, iso_3166_1, country), keep the
+            # pairs whose title row survived the filter
+            with stage('filter'):
+                mask = np.zeros(len(self.engine.df), dtype=bool)
+                mask[self.rows] = True
+                countries_df = self.engine.countries_df
+                self._countries = countries_df[mask[countries_df['row'].to_numpy()]]
+        return self._countries
+
+    @property
+    def country_counts(self):
+        """Titles per production country, largest first
+
+        Counted with one ``bincount`` over the country codes of the rows, from
+        the title x country index.  Tied countries are ranked by name
+        (see ``rank_counts``), the same in every query mode.
+        """
+        if self._country_counts is None:
+            with stage('aggregate'):
+                countries = self.engine.indexes.countries
+                counts = pd.Series(countries.counts(self.rows), index=countries.names, name='count')
+                self._country_counts = rank_counts(counts[counts > 0])
+        return self._country_counts
+
+    def platform_rows(self, platform):
+        """The rows on ``platform``"""
+        rows = self._platform_rows.get(platform)
+        if rows is None:
+            indexes = self.engine.indexes
+            with stage('filter'):
+                rows = self.rows[(indexes.platform_mask[self.rows] & indexes.platform_bits([platform])) != 0]
+            self._platform_rows[platform] = rows
+        return rows
+
+
+class FilterEngine:
+    """Computes the filtered row set once per distinct control state
+
+    Every callback receives the same ``(platform-selector, year-slider,
+    rating-slider)`` values, so results are shared through an LRU cache keyed
+    by the normalized filter state.
+    """
+
+    def __init__(self, df, countries_df, platforms, indexes, maxsize=32):
+        self.df = df
+        self.countries_df = countries_df
+        self.platforms = platforms
+        self.indexes = indexes
+        self.cache = LRUCache(maxsize)
+
+    def query(self, selected_platforms, year_range, rating_range):
+        key = normalize_filter(selected_platforms, year_range, rating_range, self.platforms)
+        result = self.cache.get_or_compute(key, lambda: self._compute(*key))
+        add_rows(len(result.rows))
+        return result
+
+    def titles(self, selected_platforms, year_range, rating_range):
+        return self.query(selected_platforms, year_range, rating_range).titles
+
+    def countries(self, selected_platforms, year_range, rating_range):
+        return self.query(selected_platforms, year_range, rating_range).countries
+
+    def stats(self):
+        return self.cache.stats()
+
+    def appended(self, df, countries_df, indexes, first_row):
+        """Engine over frames grown by the rows from ``first_row`` on
+
+        Cached results carry over, extended with the matching new rows, so
+        filter states already seen are not recomputed over the whole frame.
+        """
+        engine = FilterEngine(df, countries_df, self.platforms, indexes, self.cache.maxsize)
+        for key, result in self.cache.items():
+            rows = np.concatenate([result.rows, batch_rows(indexes, first_row, *key)])
+            rows.flags.writeable = False
+            engine.cache.put(key, FilterResult(engine, rows))
+        return engine
+
+    @timed('filter')
+    def _compute(self, selected_platforms, year_range, rating_range):
+        rows = indexed_rows(self.indexes, selected_platforms, year_range, rating_range)
+        rows.flags.writeable = False
+        return FilterResult(self, rows)
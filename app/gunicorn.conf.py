@@ -0,0 +1,21 @@
+# Gunicorn settings, run from the app directory with:
+#
+#   gunicorn -c gunicorn.conf.py main:server
+import os
+
+bind = os.environ.get('DASHBOARD_BIND', '0.0.0.0:8053')
+workers = int(os.environ.get('DASHBOARD_WORKERS', '4'))
+# Threads per worker, so identical requests share one computation and a
+# newer request can overtake an older one still running
+threads = int(os.environ.get('DASHBOARD_THREADS', '4'))
+
+# Workers memory-map the prepared columns from the binary cache instead of
+# each holding a private copy of the dataset
+raw_env = ['DASHBOARD_SHARED_MEMORY=1']
+
+
+def on_starting(server):
+    # Build the cache once in the master so booting workers only attach to it
+    from data import load_data
+    parse_workers = os.environ.get('DASHBOARD_PARSE_WORKERS')
+    load_data(shared=True, workers=int(parse_workers) if parse_workers else None)
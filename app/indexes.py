@@ -0,0 +1,229 @@
+# Precomputed indexes over the title frame
+import numpy as np
+import pandas as pd
+
+# TMDB genre names containing a space, kept whole when splitting ``genres``
+MULTI_WORD_GENRES = ('Science Fiction', 'TV Movie')
+
+
+def selection_bits(platforms, selected_platforms):
+    """Platform bitmask with the bit of every selected platform set"""
+    bits = 0
+    for platform in selected_platforms:
+        bits |= 1 << platforms.index(platform)
+    return bits
+
+
+def split_genres(genres):
+    """Split the space-separated ``genres`` strings into genre names
+
+    Returns ``(lengths, names)`` where ``lengths`` holds the number of genres
+    per row and ``names`` the flattened genre names in row order.
+    """
+    values = pd.Series(genres, dtype=object).fillna('').astype(str)
+    for genre in MULTI_WORD_GENRES:
+        values = values.str.replace(genre, genre.replace(' ', '\0'), regex=False)
+    tokens = values.str.split()
+    lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    names = [name.replace('\0', ' ') for row in tokens for name in row]
+    return lengths, names
+
+
+def gather_rows(indptr, rows):
+    """Positions of the entries of ``rows`` in a CSR matrix's column array, row by row"""
+    starts = indptr[rows]
+    lengths = indptr[np.asarray(rows) + 1] - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum()), lengths
+
+
+class IncidenceIndex:
+    """Sparse multi-hot title x value matrix in CSR form, for genres, countries and languages
+
+    Row ``i`` holds the value codes ``codes[indptr[i]:indptr[i + 1]]``, which
+    index ``names``.  Counting values over a set of titles then costs one
+    ``bincount`` over their non-zero entries instead of grouping strings.
+    """
+
+    def __init__(self, lengths, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        self.indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.codes = codes.astype(np.int32)
+        self.names = np.asarray(uniques, dtype=str)
+
+    @classmethod
+    def from_arrays(cls, indptr, codes, names):
+        index = cls.__new__(cls)
+        index.indptr = indptr
+        index.codes = codes
+        index.names = names
+        return index
+
+    def appended(self, batch):
+        """New index with the rows of the index ``batch`` added as the last rows
+
+        Values not seen before get new codes after the existing ones.
+        """
+        known = pd.Index(self.names).get_indexer(batch.names)
+        new = known < 0
+        known[new] = len(self.names) + np.arange(new.sum())
+        return IncidenceIndex.from_arrays(
+            np.concatenate((self.indptr, batch.indptr[1:] + self.indptr[-1])),
+            np.concatenate((self.codes, known[batch.codes].astype(np.int32))),
+            np.concatenate((self.names, batch.names[new])),
+        )
+
+    def counts(self, rows):
+        """Titles among ``rows`` per value code"""
+        positions, _ = gather_rows(self.indptr, rows)
+        return np.bincount(self.codes[positions], minlength=len(self.names))
+
+    def platform_counts(self, rows, platform_mask, bits):
+        """(platform, value) matrix of title counts over ``rows``, one platform per bitmask in ``bits``
+
+        The product of the rows' platform membership with their multi-hot
+        rows, computed with one ``bincount`` per platform over the non-zero
+        entries.
+        """
+        positions, lengths = gather_rows(self.indptr, rows)
+        codes = self.codes[positions]
+        masks = np.repeat(platform_mask[rows], lengths)
+        return np.array([
+            np.bincount(codes, weights=(masks & bit) != 0, minlength=len(self.names)).astype(np.int64)
+            for bit in bits
+        ]).reshape(len(bits), len(self.names))
+
+
+class SortedIndex:
+    """Row positions ordered by one column, answering range lookups by binary search"""
+
+    def __init__(self, values):
+        values = np.asarray(values)
+        # NaNs sort last, so they never fall inside a searchsorted range
+        self.order = np.argsort(values, kind='stable')
+        self.sorted_values = values[self.order]
+
+    @classmethod
+    def from_arrays(cls, order, sorted_values):
+        """Rebuild an index from previously computed arrays, without copying them"""
+        index = cls.__new__(cls)
+        index.order = order
+        index.sorted_values = sorted_values
+        return index
+
+    def merged(self, values, first_row):
+        """New index with ``values`` added as rows ``first_row`` onwards
+
+        The batch is sorted on its own and merged into the existing order in
+        O(n + k log k), instead of sorting all n + k values again.  New rows
+        go after existing rows with the same value, as a stable sort of the
+        whole column would put them.
+        """
+        batch = SortedIndex(values)
+        positions = np.searchsorted(self.sorted_values, batch.sorted_values, side='right')
+        return SortedIndex.from_arrays(
+            np.insert(self.order, positions, batch.order + first_row),
+            np.insert(self.sorted_values, positions, batch.sorted_values),
+        )
+
+    def bounds(self, low, high):
+        start = np.searchsorted(self.sorted_values, low, side='left')
+        end = np.searchsorted(self.sorted_values, high, side='right')
+        return start, max(start, end)
+
+    def count(self, low, high):
+        start, end = self.bounds(low, high)
+        return end - start
+
+    def range(self, low, high):
+        """Positions of the rows with ``low <= value <= high``, in value order"""
+        start, end = self.bounds(low, high)
+        return self.order[start:end]
+
+
+class TitleIndexes:
+    """Sorted indexes on ``Year`` and ``vote_average``, the platform bitmask, and title x genre, country and
+    language matrices
+
+    Built once at load time.
+    """
+
+    def __init__(self, df, platforms, arrays=None, incidences=None):
+        self.platforms = list(platforms)
+        self.platform_mask = df['platform_mask'].to_numpy()
+        self.year_values = df['Year'].to_numpy()
+        self.rating_values = df['vote_average'].to_numpy()
+        if arrays is None:
+            self.year = SortedIndex(self.year_values)
+            self.rating = SortedIndex(self.rating_values)
+            self.genres = IncidenceIndex(*split_genres(df['genres']))
+            self.countries = incidences['countries']
+            self.languages = incidences['languages']
+        else:
+            self.year = SortedIndex.from_arrays(arrays['year_order'], arrays['year_sorted'])
+            self.rating = SortedIndex.from_arrays(arrays['rating_order'], arrays['rating_sorted'])
+            self.genres = IncidenceIndex.from_arrays(arrays['genre_indptr'], arrays['genre_codes'],
+                                                     arrays['genre_names'])
+            self.countries = IncidenceIndex.from_arrays(arrays['country_indptr'], arrays['country_codes'],
+                                                        arrays['country_names'])
+            self.languages = IncidenceIndex.from_arrays(arrays['language_indptr'], arrays['language_codes'],
+                                                        arrays['language_names'])
+
+    def appended(self, df, first_row, incidences):
+        """Indexes over ``df``, whose rows from ``first_row`` on are new, reusing this index
+
+        ``incidences`` are the country and language indexes of the new rows,
+        as ``prepare_titles`` returns them.
+        """
+        indexes = TitleIndexes.__new__(TitleIndexes)
+        indexes.platforms = self.platforms
+        indexes.platform_mask = df['platform_mask'].to_numpy()
+        indexes.year_values = df['Year'].to_numpy()
+        indexes.rating_values = df['vote_average'].to_numpy()
+        indexes.year = self.year.merged(indexes.year_values[first_row:], first_row)
+        indexes.rating = self.rating.merged(indexes.rating_values[first_row:], first_row)
+        indexes.genres = self.genres.appended(IncidenceIndex(*split_genres(df['genres'].to_numpy()[first_row:])))
+        indexes.countries = self.countries.appended(incidences['countries'])
+        indexes.languages = self.languages.appended(incidences['languages'])
+        return indexes
+
+    def arrays(self):
+        """The computed index arrays, as accepted by ``TitleIndexes(..., arrays=...)``"""
+        return {
+            'year_order': self.year.order,
+            'year_sorted': self.year.sorted_values,
+            'rating_order': self.rating.order,
+            'rating_sorted': self.rating.sorted_values,
+            'genre_indptr': self.genres.indptr,
+            'genre_codes': self.genres.codes,
+            'genre_names': self.genres.names,
+            'country_indptr': self.countries.indptr,
+            'country_codes': self.countries.codes,
+            'country_names': self.countries.names,
+            'language_indptr': self.languages.indptr,
+            'language_codes': self.languages.codes,
+            'language_names': self.languages.names,
+        }
+
+    def platform_bits(self, selected_platforms):
+        """Bitmask selecting any of ``selected_platforms``"""
+        return self.platform_mask.dtype.type(selection_bits(self.platforms, selected_platforms))
+
+    def range_rows(self, year_range, rating_range):
+        """Sorted positions of the titles inside both slider ranges
+
+        Both ranges are counted by binary search, the narrower one is sliced
+        out of its index and the other range is checked on just those rows.
+        Finding the rows costs O(log n + k) for the k rows of the narrower
+        range; putting the matches back in row order, which keeps filtered
+        frames and sums in catalog order, brings the total to O(log n + k log k).
+        """
+        if self.year.count(*year_range) <= self.rating.count(*rating_range):
+            rows = self.year.range(*year_range)
+            values = self.rating_values[rows]
+            rows = rows[(values >= rating_range[0]) & (values <= rating_range[1])]
+        else:
+            rows = self.rating.range(*rating_range)
+            values = self.year_values[rows]
+            rows = rows[(values >= year_range[0]) & (values <= year_range[1])]
+        return np.sort(rows)
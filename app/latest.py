@@ -0,0 +1,104 @@
+# Dropping superseded callback requests
+#
+# Dragging a slider sends one request per position the handle passes, and the
+# browser only keeps the answer to the last one.  Each browser gets a session
+# cookie, and every request of a callback records itself as that session's
+# latest for the callback.  A request that a newer one from the same session
+# has overtaken stops at the next checkpoint and answers ``PreventUpdate``,
+# leaving the chart as it is until the newer answer arrives.
+#
+# Checkpoints sit where skipping ahead saves work without losing any: before
+# a figure is looked up, while waiting on a figure another request is
+# building, and before the built figure is decoded.  A computation that has
+# started always finishes, since other requests may be waiting on it and its
+# result is cached for the next time the handle passes that position.
+import functools
+import threading
+import uuid
+
+from dash.exceptions import PreventUpdate
+from flask import request
+
+SESSION_COOKIE = 'dashboard_session'
+
+_local = threading.local()
+
+
+def checkpoint():
+    """Stop the running callback if a newer request of its session has arrived, a no-op otherwise"""
+    ticket = getattr(_local, 'ticket', None)
+    if ticket is not None:
+        ticket.check()
+
+
+class _Ticket:
+    """One guarded callback request: its session, callback and sequence number"""
+
+    def __init__(self, tracker, key, sequence):
+        self.tracker = tracker
+        self.key = key
+        self.sequence = sequence
+
+    def check(self):
+        if self.tracker.latest(self.key) != self.sequence:
+            self.tracker.dropped(self.key[1])
+            raise PreventUpdate
+
+
+class LatestRequests:
+    """Latest request per (session, callback), and how many requests were dropped per callback"""
+
+    def __init__(self):
+        self.superseded = {}
+        self._latest = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def register(self, server):
+        """Give every browser loading the dashboard a session cookie"""
+        @server.after_request
+        def set_session_cookie(response):
+            if SESSION_COOKIE not in request.cookies and response.mimetype == 'text/html':
+                response.set_cookie(SESSION_COOKIE, uuid.uuid4().hex, httponly=True, samesite='Lax')
+            return response
+
+    def guard(self, name):
+        """Decorator making each call of a callback the latest of its session under ``name``
+
+        Requests without the session cookie are never dropped.
+        """
+        def decorator(callback):
+            @functools.wraps(callback)
+            def wrapper(*args, **kwargs):
+                session = request.cookies.get(SESSION_COOKIE)
+                if session is None:
+                    return callback(*args, **kwargs)
+                key = (session, name)
+                with self._lock:
+                    self._sequence += 1
+                    self._latest[key] = self._sequence
+                    ticket = _Ticket(self, key, self._sequence)
+                outer = getattr(_local, 'ticket', None)
+                _local.ticket = ticket
+                try:
+                    return callback(*args, **kwargs)
+                finally:
+                    _local.ticket = outer
+                    with self._lock:
+                        # The last request of a session forgets it, so idle sessions hold no memory
+                        if self._latest.get(key) == ticket.sequence:
+                            del self._latest[key]
+            return wrapper
+        return decorator
+
+    def latest(self, key):
+        with self._lock:
+            return self._latest.get(key)
+
+    def dropped(self, name):
+        with self._lock:
+            self.superseded[name] = self.superseded.get(name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len({session for session, _ in self._latest}), 'superseded': dict(self.superseded)}
@@ -0,0 +1,152 @@
+# Bounded LRU cache with hit/miss/eviction counters
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache holding at most ``maxsize`` entries
+
+    With ``ttl`` set, entries also expire that many seconds after they were
+    stored.  With ``max_weight`` set, least recently used entries are also
+    evicted while the ``weigh(value)`` of the entries adds up to more, though
+    the entry stored last is always kept.  Concurrent misses on one key are computed once: the first caller
+    computes and the others wait for its value (``coalesced`` counts them).
+    """
+
+    def __init__(self, maxsize=128, ttl=None, max_weight=None, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        # key -> (expiry time or None, value, weight)
+        self._entries = OrderedDict()
+        # key -> _Flight of the computation in progress
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                expires, value, _ = self._entries[key]
+                if expires is None or time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        weight = 0 if self.weigh is None else self.weigh(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, value, weight)
+            self.weight += weight
+            while len(self._entries) > self.maxsize or (
+                    self.max_weight is not None and self.weight > self.max_weight and len(self._entries) > 1):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.weight -= self._entries.pop(key)[2]
+
+    def get_or_compute(self, key, compute, interrupt=None):
+        """Return the cached value for ``key``, calling ``compute()`` on a miss
+
+        If another thread is already computing ``key``, wait for its value
+        (or its exception) instead of computing it again.  ``interrupt`` is
+        called every ``WAIT_POLL`` seconds while waiting and may raise to stop
+        waiting; the computation itself carries on for the other callers.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result(interrupt)
+
+        try:
+            value = compute()
+        except BaseException as error:
+            flight.error = error
+            raise
+        else:
+            self.put(key, value)
+            flight.value = value
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return value
+
+    def items(self):
+        """(key, value) pairs from least to most recently used, without counting as lookups"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires, value, _) in self._entries.items()
+                    if expires is None or now < expires]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'weight': self.weight,
+            'max_weight': self.max_weight,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'coalesced': self.coalesced,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Seconds between ``interrupt`` checks while waiting on another thread's computation
+WAIT_POLL = 0.05
+
+_MISSING = object()
+
+
+class _Flight:
+    """A computation in progress, that callers missing the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self, interrupt=None):
+        while not self.done.wait(None if interrupt is None else WAIT_POLL):
+            interrupt()
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -1,69 +1,101 @@
 # Streaming Platforms Dashboard
+import copy
+import logging
+import os
 import dash
 from dash import Dash, dcc, html
+from flask import Response, jsonify, request
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
-import json
 from callbacks import register_callbacks
+from clientside import register_clientside_callbacks
+from catalog import Catalog, DropFolder
+from catalogs import DEFAULT_CATALOG, DEFAULT_MEMORY_MB, Catalogs, parse_catalogs, register_catalog_selector
+from data import CACHE_DIR, DATA_PATH, PLATFORMS, load_data, log_memory_report
+from figure_cache import DEFAULT_MAXSIZE, DEFAULT_TTL, FigureCache
+from latest import LatestRequests
+from lru import LRUCache
+from patches import structure_store_id
+from payload import (DEFAULT_BUDGET_BYTES, DEFAULT_DIGITS, DEFAULT_LEVEL, DEFAULT_MIN_SIZE, FigureBudget,
+                     ResponseCompression)
+from queries import FrameQueries, SummaryQueries
+from streaming import DEFAULT_MEMORY_LIMIT_MB, ingest
+from timing import CallbackTimings, cache_lines
+from warmer import DEFAULT_WORKERS, AccessLog, CacheWarmer, common_states, read_states
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
 
 app = Dash(__name__, external_stylesheets=[
     'https://fonts.googleapis.com/css2?family=Montserrat:wght@300;400;500;600;700&display=swap'
 ])
 app.title = "Streaming Platforms Dashboard"
+server = app.server  # WSGI entry point for gunicorn
+
+platforms = PLATFORMS
 
-def load_data():
-    """Load and prepare the data"""
-    import os
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    data_path = os.path.join(base_dir, 'datasets', 'cleaned', 'movies_cleaned.csv')
-    df = pd.read_csv(data_path)
-    
-    def extract_country_names(countries_json):
-        try:
-            if pd.isna(countries_json) or countries_json == '[]':
-                return []
-            countries = json.loads(countries_json)
-            return [country['name'] for country in countries]
-        except:
-            return []
-    
-    def extract_language_names(languages_json):
-        try:
-            if pd.isna(languages_json) or languages_json == '[]':
-                return []
-            languages = json.loads(languages_json)
-            return [lang['name'] for lang in languages]
-        except:
-            return []
-    
-    df['country_names'] = df['production_countries'].apply(extract_country_names)
-    df['language_names'] = df['spoken_languages'].apply(extract_language_names)
-    
-    countries_expanded = []
-    for idx, row in df.iterrows():
-        for country in row['country_names']:
-            new_row = row.copy()
-            new_row['country'] = country
-            countries_expanded.append(new_row)
-    
-    countries_df = pd.DataFrame(countries_expanded)
-    
-    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
-    df['release_month'] = df['release_date'].dt.month
-    df['release_year'] = df['release_date'].dt.year
-    
-    return df, countries_df
 
-df, countries_df = load_data()
-platforms = ['Netflix', 'Hulu', 'Prime Video', 'Disney+']
+def load_queries(data_path=DATA_PATH):
+    """Queries over the catalog at ``data_path``, prepared the way the environment asks"""
+    if os.environ.get('DASHBOARD_STREAMING') == '1':
+        # Catalogs larger than RAM: stream the CSV into aggregates and keep no rows
+        summaries = ingest(
+            data_path,
+            platforms=platforms,
+            memory_limit_mb=float(os.environ.get('DASHBOARD_MEMORY_LIMIT_MB', DEFAULT_MEMORY_LIMIT_MB)),
+            # Country and genre answers from bounded-size sketches, marked approximate in the charts
+            approximate=os.environ.get('DASHBOARD_APPROXIMATE') == '1'
+        )
+        return SummaryQueries(summaries)
+    # Under gunicorn every worker imports this module; DASHBOARD_SHARED_MEMORY=1
+    # memory-maps the cached columns so the workers share one copy of the data
+    df, countries_df, indexes = load_data(
+        data_path,
+        platforms=platforms,
+        shared=os.environ.get('DASHBOARD_SHARED_MEMORY') == '1',
+        workers=int(os.environ['DASHBOARD_PARSE_WORKERS']) if os.environ.get('DASHBOARD_PARSE_WORKERS') else None
+    )
+    # Bytes per serving column and index array, to size containers from
+    log_memory_report(df, countries_df, indexes)
+    return FrameQueries(df, countries_df, platforms, indexes)
+
+
+def year_slider_bounds(queries):
+    """Year slider range for a catalog (streaming era)"""
+    data_min_year, max_year = queries.year_bounds()
+    return max(2000, data_min_year), max_year  # Start from 2000 or data minimum
+
+
+queries = load_queries()
+catalog = Catalog(queries)
+# Further catalogs named in DASHBOARD_CATALOGS (name=path,...) are loaded when
+# a page first asks for them, and kept within DASHBOARD_CATALOG_MEMORY_MB
+catalogs = Catalogs(
+    catalog, parse_catalogs(os.environ.get('DASHBOARD_CATALOGS', '')), load_queries,
+    max_bytes=float(os.environ.get('DASHBOARD_CATALOG_MEMORY_MB', DEFAULT_MEMORY_MB)) * 2 ** 20
+)
+catalogs.register(server)
+# CSV batches of new titles dropped into DASHBOARD_DROP_DIR are appended while serving
+if os.environ.get('DASHBOARD_DROP_DIR'):
+    drop_folder = DropFolder(
+        catalog, os.environ['DASHBOARD_DROP_DIR'],
+        interval=float(os.environ.get('DASHBOARD_DROP_INTERVAL', 5))
+    ).start()
 
 # Get reasonable year range (streaming era)
-min_year = max(2000, df['Year'].min())  # Start from 2000 or data minimum
-max_year = df['Year'].max()
+min_year, max_year = year_slider_bounds(queries)
+
+CHARTS = ['netflix-growth-chart', 'world-map-chart', 'genre-heatmap-chart', 'platform-comparison-chart',
+          'seasonal-chart', 'correlation-chart', 'countries-bar-chart']
+
+layout = html.Div([
+    # Aggregates for the client-side filtering mode, sent once per page load
+    dcc.Location(id='url'),
+    dcc.Store(id='client-aggregates'),
+    # Structure of the figure each chart shows, so slider moves can send Patches
+    *[dcc.Store(id=structure_store_id(chart)) for chart in CHARTS],
 
-app.layout = html.Div([
     # Fixed Sticky Header
     html.Div([
         html.H1("Streaming Platforms Content Analysis", style={
@@ -107,6 +139,25 @@ app.layout = html.Div([
                 'marginBottom': '24px'
             }),
             
+            # Only shown when there are catalogs to choose from
+            *([html.Div([
+                html.Label("Catalog:", style={
+                    'fontWeight': '500', 
+                    'marginBottom': 12, 
+                    'display': 'block',
+                    'fontFamily': 'Montserrat, sans-serif',
+                    'color': '#495057',
+                    'fontSize': '14px'
+                }),
+                dcc.Dropdown(
+                    id='catalog-selector',
+                    options=[{'label': name, 'value': name} for name in catalogs.names],
+                    value=DEFAULT_CATALOG,
+                    clearable=False,
+                    style={'fontFamily': 'Montserrat, sans-serif', 'fontSize': '13px'}
+                )
+            ], style={'marginBottom': 28})] if catalogs.paths else []),
+            
             html.Div([
                 html.Label("Streaming Platforms:", style={
                     'fontWeight': '500', 
@@ -269,8 +320,119 @@ app.layout = html.Div([
     ])
 ])
 
-# Register callbacks
-register_callbacks(app, df, countries_df, platforms)
+slider_bounds = LRUCache(16)
+
+
+def active_year_bounds():
+    """Year slider range of the catalog the current request answers from"""
+    with catalogs.pinned():
+        return slider_bounds.get_or_compute(catalogs.version(), lambda: year_slider_bounds(catalogs.snapshot()))
+
+
+def serve_layout():
+    """The layout for the catalog the page asks for, its year slider fitted to that catalog"""
+    if not catalogs.paths:
+        return layout
+    page = copy.deepcopy(layout)
+    page['catalog-selector'].value = catalogs.requested()
+    low, high = active_year_bounds()
+    slider = page['year-slider']
+    slider.min, slider.max, slider.value = low, high, [low, high]
+    slider.marks = {year: {'label': f'{year}', 'style': {'fontSize': 10, 'fontFamily': 'Montserrat'}}
+                    for year in range(low, high + 1, 5)}
+    return page
+
+
+app.layout = serve_layout
+if catalogs.paths:
+    register_catalog_selector(app)
+
+# Register callbacks, with built figures cached per normalized filter state;
+# requested states are logged to DASHBOARD_ACCESS_LOG for the cache warmer
+os.makedirs(CACHE_DIR, exist_ok=True)
+access_log = AccessLog(os.environ.get('DASHBOARD_ACCESS_LOG', os.path.join(CACHE_DIR, 'access.log')))
+figure_cache = FigureCache(
+    catalogs, platforms, active_year_bounds if catalogs.paths else (min_year, max_year),
+    maxsize=int(os.environ.get('DASHBOARD_FIGURE_CACHE_SIZE', DEFAULT_MAXSIZE)),
+    ttl=float(os.environ.get('DASHBOARD_FIGURE_CACHE_TTL', DEFAULT_TTL)),
+    access_log=access_log,
+    # Figures are slimmed (template, unused hover data, float digits) to fit a byte budget
+    budget=FigureBudget(
+        max_bytes=int(os.environ.get('DASHBOARD_FIGURE_BUDGET_BYTES', DEFAULT_BUDGET_BYTES)),
+        digits=int(os.environ.get('DASHBOARD_FIGURE_DIGITS', DEFAULT_DIGITS))
+    )
+)
+# Responses are gzipped above DASHBOARD_COMPRESS_MIN_SIZE bytes; level 0 turns this off
+compression = ResponseCompression(
+    level=int(os.environ.get('DASHBOARD_COMPRESS_LEVEL', DEFAULT_LEVEL)),
+    min_size=int(os.environ.get('DASHBOARD_COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE))
+)
+compression.register(server)
+# DASHBOARD_TIMING=1 times every chart callback by stage for /metrics
+timings = CallbackTimings(enabled=os.environ.get('DASHBOARD_TIMING') == '1')
+# Requests overtaken by a newer one from the same browser (slider drags) are dropped
+latest = LatestRequests()
+latest.register(server)
+if os.environ.get('DASHBOARD_CLIENTSIDE') == '1':
+    # Charts are filtered and drawn in the browser from aggregates sent once per session
+    register_clientside_callbacks(app, catalogs)
+else:
+    # DASHBOARD_SINGLE_CALLBACK=1 serves the metrics and all charts from one request per interaction
+    # Charts get Patches of their data when only the data changed, unless DASHBOARD_FULL_FIGURES=1
+    register_callbacks(app, catalogs, figure_cache, combined=os.environ.get('DASHBOARD_SINGLE_CALLBACK') == '1',
+                       timings=timings, latest=latest, patch=os.environ.get('DASHBOARD_FULL_FIGURES') != '1')
+
+# Charts for the default, recently popular and common filter states are built
+# in the background at startup; DASHBOARD_WARM_WORKERS=0 turns this off
+warmer = None
+warm_workers = int(os.environ.get('DASHBOARD_WARM_WORKERS', DEFAULT_WORKERS))
+if warm_workers > 0 and figure_cache.callbacks:
+    warm_states = common_states(platforms, (min_year, max_year))
+    warm_states[1:1] = access_log.popular()
+    if os.environ.get('DASHBOARD_WARM_STATES'):
+        warm_states += read_states(os.environ['DASHBOARD_WARM_STATES'])
+    warmer = CacheWarmer(figure_cache, warm_states, workers=warm_workers).start()
+
+
+def wants_prometheus():
+    """Whether the /metrics request is a Prometheus scrape rather than a browser or curl"""
+    if request.args.get('format') == 'prometheus':
+        return True
+    accepted = [value.split(';')[0].strip() for value, _ in request.accept_mimetypes]
+    return 'application/json' not in accepted and bool({'text/plain', 'application/openmetrics-text'} & set(accepted))
+
+
+@server.route('/metrics')
+def metrics():
+    snapshot = catalog.snapshot()
+    caches = {
+        'figure': figure_cache.stats(),
+        'filter': snapshot.engine.stats() if snapshot.has_rows else None,
+    }
+    if wants_prometheus():
+        lines = timings.prometheus_lines() + compression.prometheus_lines() + cache_lines(caches) + [
+            '# TYPE dashboard_catalog_batches gauge',
+            f'dashboard_catalog_batches {catalog.batches}',
+            '# TYPE dashboard_catalog_appended_titles gauge',
+            f'dashboard_catalog_appended_titles {catalog.appended_titles}',
+            '# HELP dashboard_superseded_requests_total Callback requests dropped for a newer one',
+            '# TYPE dashboard_superseded_requests_total counter',
+        ] + [
+            f'dashboard_superseded_requests_total{{callback="{name}"}} {count}'
+            for name, count in latest.stats()['superseded'].items()
+        ]
+        return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+    return jsonify({
+        'figure_cache': caches['figure'],
+        'filter_cache': caches['filter'],
+        'catalog': {'batches': catalog.batches, 'appended_titles': catalog.appended_titles},
+        'callbacks': timings.stats() if timings.enabled else None,
+        'requests': latest.stats(),
+        'responses': compression.stats(),
+        'figures_over_budget': figure_cache.budget.over_budget,
+        'warmer': warmer.stats() if warmer is not None else None,
+        'catalogs': catalogs.stats() if catalogs.paths else None,
+    })
 
 if __name__ == '__main__':
     app.run_server(debug=True, port=8053)
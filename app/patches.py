@@ -0,0 +1,89 @@
+# Partial figure updates
+#
+# Moving a slider usually changes only the numbers in a chart: the traces,
+# their styling, the axes and the plotly template stay the same.  Next to
+# every graph the browser keeps a store holding the structure hash of the
+# figure it shows.  When the new figure has the same structure, the callback
+# answers with a ``dash.Patch`` that replaces just the traces' arrays and the
+# annotation texts; otherwise it sends the whole figure and its new hash.
+# Figure and hash are outputs of the same callback, so a response the
+# browser drops never leaves them out of step.
+#
+# The structure is everything in the figure except the array values in the
+# traces and the texts of the annotations: trace count, types, names and
+# styling, which array fields each trace has, and the whole layout.
+import hashlib
+import json
+
+from dash import Patch, no_update
+
+from timing import stage
+
+
+def structure_store_id(chart):
+    """Id of the store holding the structure hash of the figure in ``chart``"""
+    return f'{chart}-structure'
+
+
+def _array_paths(value, path=()):
+    """(path, array) of every list inside a trace, nested dicts included"""
+    if isinstance(value, list):
+        yield path, value
+    elif isinstance(value, dict):
+        if 'bdata' in value and 'dtype' in value:
+            # A typed array, as plotly encodes numpy arrays
+            yield path, value
+            return
+        for key, item in value.items():
+            yield from _array_paths(item, path + (key,))
+
+
+def _blank(value):
+    """A trace with each array replaced by a marker, so only its shape is left"""
+    if isinstance(value, list) or (isinstance(value, dict) and 'bdata' in value and 'dtype' in value):
+        return '<array>'
+    if isinstance(value, dict):
+        return {key: _blank(item) for key, item in value.items()}
+    return value
+
+
+def figure_structure(figure):
+    """Hash of ``figure`` without its trace arrays and annotation texts"""
+    layout = dict(figure.get('layout', {}))
+    if 'annotations' in layout:
+        layout['annotations'] = [{key: item for key, item in annotation.items() if key != 'text'}
+                                 for annotation in layout['annotations']]
+    shape = {'data': [_blank(trace) for trace in figure.get('data', [])], 'layout': layout}
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode()).hexdigest()
+
+
+def data_patch(figure):
+    """``Patch`` turning a figure of the same structure into ``figure``"""
+    patch = Patch()
+    for i, trace in enumerate(figure.get('data', [])):
+        for path, array in _array_paths(trace):
+            target = patch['data'][i]
+            for key in path[:-1]:
+                target = target[key]
+            target[path[-1]] = array
+    for i, annotation in enumerate(figure.get('layout', {}).get('annotations', [])):
+        if 'text' in annotation:
+            patch['layout']['annotations'][i]['text'] = annotation['text']
+    return patch
+
+
+def patching(build):
+    """Wrap a figure callback to answer ``[figure or Patch, structure hash]``
+
+    The wrapped callback takes the structure hash the browser holds as an
+    extra last argument.
+    """
+    def wrapper(*args):
+        *inputs, known = args
+        figure = build(*inputs)
+        with stage('serialize'):
+            structure = figure_structure(figure)
+            if structure == known:
+                return [data_patch(figure), no_update]
+        return [figure, structure]
+    return wrapper
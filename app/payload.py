@@ -0,0 +1,180 @@
+# Response size: figure slimming and compression
+#
+# A figure is slimmed once, when the FigureCache builds it:
+#
+#   template   plotly embeds default styling for ~25 trace types in every
+#              figure; only the entries of the trace types the figure draws
+#              are kept
+#   hover      customdata and hovertext arrays no hovertemplate or text
+#              template refers to are dropped
+#   floats     fractional values are rounded to FigureBudget.digits
+#              significant digits, and to COARSE_DIGITS if the figure is
+#              still over its byte budget
+#
+# Every response of the Dash server above min_size bytes is then gzipped for
+# clients that accept it, and the bytes per callback, before and after
+# compression, are counted for /metrics.
+import gzip
+import logging
+import threading
+
+import numpy as np
+from flask import request
+from plotly.io.json import to_json_plotly
+
+from timing import Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIGITS = 6
+COARSE_DIGITS = 3
+DEFAULT_BUDGET_BYTES = 1 << 20
+DEFAULT_LEVEL = 6
+DEFAULT_MIN_SIZE = 500
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/html', 'text/css', 'text/plain')
+# Upper bounds in bytes of the response size histograms
+BYTE_BUCKETS = (1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000)
+
+
+def round_significant(values, digits):
+    """``values`` rounded to ``digits`` significant digits
+
+    Whole numbers (counts and vote totals stored as floats) and non-finite
+    values are left as they are.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.copy()
+    finite = np.isfinite(values) & (values != np.round(values))
+    scale = 10.0 ** (digits - 1 - np.floor(np.log10(np.abs(values[finite]))))
+    rounded[finite] = np.round(values[finite] * scale) / scale
+    return rounded
+
+
+def _round_arrays(value, digits):
+    if isinstance(value, dict):
+        return {key: _round_arrays(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)) and len(value) > 0:
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            # Ragged nested lists
+            return value
+        if array.dtype.kind == 'f':
+            return round_significant(array, digits)
+    return value
+
+
+def _drop_unused_hover(trace):
+    templates = ''.join(str(trace.get(key, '')) for key in ('hovertemplate', 'texttemplate'))
+    if 'customdata' in trace and 'customdata' not in templates:
+        del trace['customdata']
+    if 'hovertext' in trace and trace.get('hovertemplate') and 'hovertext' not in templates:
+        del trace['hovertext']
+    return trace
+
+
+def slim_figure(figure, digits):
+    """Plotly JSON dict of ``figure`` with the template trimmed, unused hover data dropped and floats rounded"""
+    figure = figure.to_plotly_json() if hasattr(figure, 'to_plotly_json') else figure
+    data = [_round_arrays(_drop_unused_hover(dict(trace)), digits) for trace in figure.get('data', [])]
+    layout = dict(figure.get('layout', {}))
+    template = layout.get('template')
+    if template and 'data' in template:
+        types = {trace.get('type', 'scatter') for trace in data}
+        layout['template'] = dict(template, data={key: value for key, value in template['data'].items()
+                                                  if key in types})
+    return {'data': data, 'layout': layout}
+
+
+class FigureBudget:
+    """Serializes figures slimmed to ``digits`` significant digits, coarser when over ``max_bytes``"""
+
+    def __init__(self, max_bytes=DEFAULT_BUDGET_BYTES, digits=DEFAULT_DIGITS):
+        self.max_bytes = max_bytes
+        self.digits = digits
+        self.over_budget = 0
+
+    def to_json(self, figure):
+        figure_json = to_json_plotly(slim_figure(figure, self.digits))
+        if len(figure_json) > self.max_bytes and self.digits > COARSE_DIGITS:
+            figure_json = to_json_plotly(slim_figure(figure, COARSE_DIGITS))
+        if len(figure_json) > self.max_bytes:
+            self.over_budget += 1
+            logger.warning("Figure of %d bytes is over the %d byte budget", len(figure_json), self.max_bytes)
+        return figure_json
+
+
+class ResponseCompression:
+    """Gzips the server's responses and counts bytes per Dash callback"""
+
+    def __init__(self, level=DEFAULT_LEVEL, min_size=DEFAULT_MIN_SIZE):
+        self.level = level
+        self.min_size = min_size
+        # callback's first output id -> {'responses', 'bytes', 'sent_bytes', 'histogram'}
+        self.callbacks = {}
+        self._lock = threading.Lock()
+
+    def register(self, server):
+        server.after_request(self.process)
+
+    def process(self, response):
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        raw_bytes = response.calculate_content_length() or 0
+        if (self.level > 0 and raw_bytes >= self.min_size and response.status_code == 200
+                and response.mimetype in COMPRESSIBLE_TYPES and 'Content-Encoding' not in response.headers
+                and 'gzip' in request.headers.get('Accept-Encoding', '')):
+            response.set_data(gzip.compress(response.get_data(), self.level))
+            response.headers['Content-Encoding'] = 'gzip'
+            response.vary.add('Accept-Encoding')
+        if request.path.endswith('/_dash-update-component'):
+            outputs = (request.get_json(silent=True) or {}).get('outputs') or [{}]
+            # Named after the callback's first output, e.g. the chart for a figure and its structure store
+            output = (outputs[0] if isinstance(outputs, list) else outputs).get('id', 'unknown')
+            self._count(str(output), raw_bytes, response.calculate_content_length() or 0)
+        return response
+
+    def _count(self, output, raw_bytes, sent_bytes):
+        with self._lock:
+            stats = self.callbacks.get(output)
+            if stats is None:
+                stats = self.callbacks[output] = {
+                    'responses': 0, 'bytes': 0, 'sent_bytes': 0, 'histogram': Histogram(BYTE_BUCKETS),
+                }
+            stats['responses'] += 1
+            stats['bytes'] += raw_bytes
+            stats['sent_bytes'] += sent_bytes
+            stats['histogram'].observe(sent_bytes)
+
+    def stats(self):
+        """Responses, mean bytes before and after compression, per callback output"""
+        with self._lock:
+            return {
+                output: {
+                    'responses': stats['responses'],
+                    'mean_bytes': stats['bytes'] / stats['responses'],
+                    'mean_sent_bytes': stats['sent_bytes'] / stats['responses'],
+                }
+                for output, stats in self.callbacks.items()
+            }
+
+    def prometheus_lines(self):
+        lines = [
+            '# HELP dashboard_response_bytes Bytes sent per callback response, after compression',
+            '# TYPE dashboard_response_bytes histogram',
+        ]
+        with self._lock:
+            for output, stats in self.callbacks.items():
+                labels = f'callback="{output}"'
+                for bound, count in stats['histogram'].cumulative():
+                    le = '+Inf' if bound == float('inf') else str(bound)
+                    lines.append(f'dashboard_response_bytes_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'dashboard_response_bytes_sum{{{labels}}} {stats["histogram"].sum}')
+                lines.append(f'dashboard_response_bytes_count{{{labels}}} {stats["responses"]}')
+            lines += [
+                '# HELP dashboard_response_uncompressed_bytes_total Callback response bytes before compression',
+                '# TYPE dashboard_response_uncompressed_bytes_total counter',
+            ]
+            lines += [f'dashboard_response_uncompressed_bytes_total{{callback="{output}"}} {stats["bytes"]}'
+                      for output, stats in self.callbacks.items()]
+        return lines
@@ -0,0 +1,251 @@
+# Query backends behind the dashboard callbacks
+#
+# The callbacks ask one of these objects for the numbers behind each chart.
+# FrameQueries answers from the in-memory title frames, SummaryQueries from
+# the aggregates built by streaming ingestion when the catalog does not fit
+# in memory.  Both expose the same DataCube as ``cube``.
+#
+# Query objects are never changed once built: ``appended(batch)`` returns a
+# new one with the batch added, so a request can keep using the one it
+# started with while new titles arrive.
+import numpy as np
+import pandas as pd
+
+from cube import DataCube, bucket_values, pearson, rating_buckets
+from data import SOURCE_COLUMNS, concat_frames, prepare_titles, widen_ratings
+from filters import FilterEngine, normalize_filter
+from indexes import selection_bits
+from lru import LRUCache
+from streaming import SUMMARY_COLUMNS, StreamingSummaries, prepare_chunks, vote_bin_edges, vote_bins
+from timing import timed
+
+
+def require_columns(batch, columns):
+    missing = [column for column in columns if column not in batch.columns]
+    if missing:
+        raise ValueError(f"Batch is missing the columns {', '.join(missing)}")
+
+
+def vote_density(table):
+    """Rating buckets, vote bin labels and the (vote bin, rating bucket) count matrix
+
+    ``table`` has one row per (``value`` vote bin, ``bucket``) with its
+    ``count``, so the result has at most one cell per bin pair however many
+    titles are counted.
+    """
+    density = table.groupby(['value', 'bucket'])['count'].sum().unstack(fill_value=0).sort_index()
+    labels = ['{:,}-{:,}'.format(*vote_bin_edges(vote_bin)) for vote_bin in density.index]
+    return bucket_values()[density.columns], labels, density.to_numpy()
+
+
+def histogram_quartiles(histogram):
+    """Box plot statistics of a rating bucket histogram"""
+    values = bucket_values()
+    present = np.flatnonzero(histogram)
+    cumulative = np.cumsum(histogram) / histogram.sum()
+    q1, median, q3 = (values[np.searchsorted(cumulative, q)] for q in (0.25, 0.5, 0.75))
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': values[present[0]],
+        'upperfence': values[present[-1]],
+    }
+
+
+class FrameQueries:
+    """Answers chart queries from the title frames through the shared filter engine"""
+
+    has_rows = True
+    approximate = False
+
+    def __init__(self, df, countries_df, platforms, indexes, engine=None, cube=None):
+        self.df = df
+        self.countries_df = countries_df
+        self.platforms = platforms
+        self.indexes = indexes
+        # One engine shared by every callback, so a slider move filters the frame once
+        self.engine = engine or FilterEngine(df, countries_df, platforms, indexes)
+        # Growth, seasonal and platform charts are answered from the cube
+        self.cube = cube or DataCube.from_frame(df, platforms)
+        self._summaries = None
+
+    @property
+    def summaries(self):
+        """``StreamingSummaries`` of the frames, built on first use"""
+        if self._summaries is None:
+            self._summaries = StreamingSummaries.from_frames(self.df, self.countries_df, self.platforms)
+        return self._summaries
+
+    def appended(self, batch):
+        """Queries over the titles plus ``batch``, raw rows with the CSV's columns
+
+        Only the batch is parsed.  The sorted indexes are merged, the cube
+        gets the batch's cells added to a copy, and the cached filter
+        results are extended with the matching new rows.
+        """
+        require_columns(batch, SOURCE_COLUMNS + self.platforms)
+        first_row = len(self.df)
+        titles, countries, incidences = prepare_titles(batch.reset_index(drop=True), self.platforms, first_row)
+        df = concat_frames([self.df, titles])
+        countries_df = concat_frames([self.countries_df, countries])
+        indexes = self.indexes.appended(df, first_row, incidences)
+        cube = self.cube.copy()
+        cube.add(titles)
+        engine = self.engine.appended(df, countries_df, indexes, first_row)
+        return FrameQueries(df, countries_df, self.platforms, indexes, engine, cube)
+
+    def year_bounds(self):
+        return int(self.df['Year'].min()), int(self.df['Year'].max())
+
+    @timed('aggregate')
+    def title_stats(self, selected_platforms, year_range, rating_range):
+        """Number of titles, their average rating and how many countries produced them"""
+        result = self.engine.query(selected_platforms, year_range, rating_range)
+        total_titles = len(result.rows)
+        avg_rating = widen_ratings(self.indexes.rating_values[result.rows]).mean() if total_titles > 0 else 0
+        return total_titles, avg_rating, len(result.country_counts)
+
+    @timed('aggregate')
+    def country_counts(self, selected_platforms, year_range, rating_range):
+        """Titles per production country, largest first"""
+        return self.engine.query(selected_platforms, year_range, rating_range).country_counts
+
+    @timed('aggregate')
+    def genre_counts(self, selected_platforms, year_range, rating_range):
+        """(genre, platform) frame of title counts, one column per selected platform
+
+        A title counts once towards each of its genres, from the multi-hot
+        genre matrix.
+        """
+        rows = self.engine.query(selected_platforms, year_range, rating_range).rows
+        genres = self.indexes.genres
+        counts = genres.platform_counts(
+            rows, self.indexes.platform_mask, [self.indexes.platform_bits([platform]) for platform in selected_platforms]
+        )
+        return pd.DataFrame(counts.T, index=genres.names, columns=list(selected_platforms))
+
+    @timed('aggregate')
+    def platform_ratings(self, platform, selected_platforms, year_range, rating_range):
+        """Ratings of the filtered titles on ``platform``"""
+        rows = self.engine.query(selected_platforms, year_range, rating_range).platform_rows(platform)
+        return widen_ratings(self.indexes.rating_values[rows])
+
+    @timed('aggregate')
+    def rating_votes(self, selected_platforms, year_range, rating_range):
+        """(vote_average, vote_count) pairs of the filtered titles"""
+        filtered_df = self.engine.titles(selected_platforms, year_range, rating_range)
+        return pd.DataFrame({
+            'vote_average': widen_ratings(filtered_df['vote_average']),
+            'vote_count': filtered_df['vote_count'].to_numpy(),
+        }).dropna()
+
+    @timed('aggregate')
+    def correlation(self, selected_platforms, year_range, rating_range):
+        """Number of titles and the Pearson correlation of rating and votes, from the cube's sums"""
+        stats = self.cube.selection_stats(selected_platforms, year_range, rating_range)
+        return stats[0], pearson(*stats)
+
+    @timed('aggregate')
+    def rating_vote_density(self, selected_platforms, year_range, rating_range):
+        """The filtered titles binned like ``SummaryQueries.rating_vote_density``"""
+        pairs = self.rating_votes(selected_platforms, year_range, rating_range)
+        return vote_density(pd.DataFrame({
+            'value': vote_bins(pairs['vote_count']),
+            'bucket': rating_buckets(pairs['vote_average']),
+            'count': 1,
+        }))
+
+
+class SummaryQueries:
+    """Answers chart queries from ``StreamingSummaries``, without any title rows
+
+    Charts that plot individual titles are drawn from distributions instead:
+    the rating violins become box plots and the ratings-vs-votes scatter a
+    density heatmap.  Over approximate summaries the distinct countries and
+    the country and genre counts are estimates, bounded by ``error_bounds``.
+    """
+
+    has_rows = False
+
+    def __init__(self, summaries):
+        self.summaries = summaries
+        self.approximate = summaries.approximate
+        self.platforms = summaries.platforms
+        self.cube = summaries.cube
+        # The metrics, the map and the bar chart all need the country counts
+        self._country_counts = LRUCache(32)
+
+    def appended(self, batch):
+        """Queries over the summaries plus ``batch``, raw rows with the CSV's columns"""
+        require_columns(batch, SUMMARY_COLUMNS + self.platforms)
+        summaries = self.summaries.copy()
+        for chunk, country_rows, countries in prepare_chunks([batch], self.platforms):
+            summaries.add(chunk, country_rows, countries)
+        summaries.compact()
+        return SummaryQueries(summaries)
+
+    def _bits(self, selected_platforms):
+        return selection_bits(self.platforms, selected_platforms)
+
+    def year_bounds(self):
+        years = self.cube.years[self.cube.counts.sum(axis=(0, 2, 3)) > 0]
+        return years.min(), years.max()
+
+    @timed('aggregate')
+    def title_stats(self, selected_platforms, year_range, rating_range):
+        n, rating_sum = self.cube.selection_stats(selected_platforms, year_range, rating_range)[:2]
+        if self.approximate:
+            countries = self.summaries.countries.distinct(self._bits(selected_platforms), year_range, rating_range)
+        else:
+            countries = int((self.country_counts(selected_platforms, year_range, rating_range) > 0).sum())
+        return n, rating_sum / n if n > 0 else 0, countries
+
+    def error_bounds(self, selected_platforms, year_range, rating_range):
+        """How far the approximate answers may be off for a filter state
+
+        ``countries`` is the relative standard error of the distinct country
+        count, ``country_counts`` and ``genre_counts`` the most any count may
+        fall short of the true one.  All zero over exact summaries.
+        """
+        if not self.approximate:
+            return {'countries': 0.0, 'country_counts': 0, 'genre_counts': 0}
+        bits = self._bits(selected_platforms)
+        return {
+            'countries': self.summaries.countries.relative_error,
+            'country_counts': self.summaries.countries.undercount(bits, year_range, rating_range),
+            'genre_counts': max((self.summaries.genres.undercount(self._bits([platform]), year_range, rating_range)
+                                 for platform in selected_platforms), default=0),
+        }
+
+    @timed('aggregate')
+    def country_counts(self, selected_platforms, year_range, rating_range):
+        key = normalize_filter(selected_platforms, year_range, rating_range, self.platforms)
+        return self._country_counts.get_or_compute(
+            key, lambda: self.summaries.countries.counts(self._bits(selected_platforms), year_range, rating_range)
+        )
+
+    @timed('aggregate')
+    def genre_counts(self, selected_platforms, year_range, rating_range):
+        """(genre, platform) frame of title counts, one column per selected platform"""
+        return pd.DataFrame({
+            platform: self.summaries.genres.counts(self._bits([platform]), year_range, rating_range)
+            for platform in selected_platforms
+        }, columns=list(selected_platforms)).fillna(0).astype(np.int64)
+
+    @timed('aggregate')
+    def rating_quartiles(self, selected_platforms, year_range, rating_range):
+        """Box plot statistics per selected platform, ``None`` for platforms without titles"""
+        histograms = self.cube.platform_rating_histograms(selected_platforms, year_range, rating_range)
+        return [histogram_quartiles(histogram) if histogram.sum() > 0 else None for histogram in histograms]
+
+    @timed('aggregate')
+    def correlation(self, selected_platforms, year_range, rating_range):
+        """Number of titles and the Pearson correlation of rating and votes"""
+        stats = self.cube.selection_stats(selected_platforms, year_range, rating_range)
+        return stats[0], pearson(*stats)
+
+    @timed('aggregate')
+    def rating_vote_density(self, selected_platforms, year_range, rating_range):
+        """Rating buckets, vote bin labels and the (vote bin, rating bucket) count matrix"""
+        return vote_density(self.summaries.vote_bins.select(self._bits(selected_platforms), year_range, rating_range))
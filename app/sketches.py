@@ -0,0 +1,213 @@
+# Approximate tallies for very large catalogs
+#
+# With DASHBOARD_APPROXIMATE=1, streaming mode keeps the country and genre
+# tallies as sketches whose size is bounded per partition, a (platform mask,
+# Year, rating bucket) cell of the cube, however many titles and distinct
+# values the catalog has.  A query merges the partitions inside the slider
+# ranges, the same cells the exact tallies select, so only the sketches are
+# approximate, never the filter:
+#
+#   frequent values   a Misra-Gries summary of at most ``capacity`` values
+#                     per partition.  Counts are never too high, and too low
+#                     by at most the partition's decrements, whose sum over the
+#                     merged partitions bounds the error of every count.
+#   distinct values   HyperLogLog registers per partition, merged by taking
+#                     the maximum, with a relative standard error of
+#                     1.04 / sqrt(2 ** precision).
+#
+# Rating distributions and averages stay exact: the cube already holds a
+# mergeable histogram and sums per partition.
+import numpy as np
+import pandas as pd
+
+from cube import bucket_range, rank_counts, rating_buckets
+
+DEFAULT_CAPACITY = 32
+DEFAULT_PRECISION = 10
+
+_HASH_BITS = 64
+
+
+def hll_update(registers, rows, hashes, precision):
+    """Fold 64-bit ``hashes`` into the HyperLogLog ``registers`` of partitions ``rows``"""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(_HASH_BITS - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (_HASH_BITS - precision)) - 1)
+    # Rank of the lowest set bit of the remaining bits, exact as a power of two
+    lowest = rest & (~rest + np.uint64(1))
+    rank = np.where(rest == 0, _HASH_BITS - precision + 1,
+                    np.log2(np.maximum(lowest, 1).astype(np.float64)).astype(np.int64) + 1)
+    np.maximum.at(registers, (rows, index), rank.astype(np.uint8))
+
+
+def hll_estimate(registers):
+    """Distinct values counted by one row of HyperLogLog registers"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting is more accurate for small cardinalities
+        estimate = m * np.log(m / zeros)
+    return estimate
+
+
+class SketchTally:
+    """Approximate counts keyed by (platform mask, Year, rating bucket, value)
+
+    A drop-in for ``Tally`` (``add``, ``select``, ``counts``), plus the error
+    bound of ``counts`` and an estimate of the distinct values selected.
+    """
+
+    PARTITION_KEYS = ['mask', 'year', 'bucket']
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, precision=DEFAULT_PRECISION, compact_every=500_000):
+        self.capacity = capacity
+        self.precision = precision
+        self.compact_every = compact_every
+        # (mask, year, bucket) -> partition id, and the key columns by id
+        self._ids = {}
+        self._keys = {key: np.zeros(0, dtype=dtype)
+                      for key, dtype in zip(self.PARTITION_KEYS, (np.uint64, np.int64, np.int64))}
+        self._registers = np.zeros((0, 1 << precision), dtype=np.uint8)
+        # Sum of the counts each partition's summary dropped, its largest undercount
+        self._decrements = np.zeros(0, dtype=np.int64)
+        self._table = pd.DataFrame({
+            'partition': pd.Series(dtype=np.int64),
+            'value': pd.Series(dtype=object),
+            'count': pd.Series(dtype=np.int64),
+        })
+        self._pending = []
+        self._pending_rows = 0
+
+    @property
+    def relative_error(self):
+        """Relative standard error of ``distinct``"""
+        return 1.04 / np.sqrt(1 << self.precision)
+
+    def _partitions(self, part):
+        """Partition id of every row of ``part``, adding the partitions not seen yet"""
+        codes, uniques = pd.MultiIndex.from_frame(part[self.PARTITION_KEYS]).factorize()
+        ids = np.empty(len(uniques), dtype=np.int64)
+        new = []
+        for i, key in enumerate(uniques):
+            partition = self._ids.get(key)
+            if partition is None:
+                partition = self._ids[key] = len(self._ids)
+                new.append(key)
+            ids[i] = partition
+        if new:
+            for column, values in zip(self.PARTITION_KEYS, zip(*new)):
+                self._keys[column] = np.concatenate([self._keys[column],
+                                                     np.asarray(values, dtype=self._keys[column].dtype)])
+            self._registers = np.vstack([self._registers,
+                                         np.zeros((len(new), self._registers.shape[1]), dtype=np.uint8)])
+            self._decrements = np.concatenate([self._decrements, np.zeros(len(new), dtype=np.int64)])
+        return ids[codes]
+
+    def add(self, masks, years, ratings, values, counts=None):
+        part = pd.DataFrame({
+            'mask': np.asarray(masks).astype(np.uint64),
+            'year': np.asarray(years, dtype=np.float64),
+            'ratings': np.asarray(ratings, dtype=np.float64),
+            'value': values,
+            'count': 1 if counts is None else counts,
+        }).dropna()
+        if len(part) == 0:
+            return
+        part['year'] = part['year'].astype(np.int64)
+        part['bucket'] = rating_buckets(part.pop('ratings'))
+        part['partition'] = self._partitions(part)
+        hll_update(self._registers, part['partition'].to_numpy(),
+                   pd.util.hash_array(part['value'].to_numpy(dtype=object)), self.precision)
+        part = part.groupby(['partition', 'value'], sort=False)['count'].sum().reset_index()
+        self._pending.append(part)
+        self._pending_rows += len(part)
+        if self._pending_rows >= self.compact_every:
+            self.compact()
+
+    def copy(self):
+        tally = SketchTally(self.capacity, self.precision, self.compact_every)
+        tally._ids = dict(self._ids)
+        # Key columns and decrements are replaced rather than changed; the
+        # registers are updated in place
+        tally._keys = dict(self._keys)
+        tally._registers = self._registers.copy()
+        tally._decrements = self._decrements
+        tally._table = self._table
+        tally._pending = list(self._pending)
+        tally._pending_rows = self._pending_rows
+        return tally
+
+    def compact(self):
+        """Merge the pending chunks and cut each partition back to ``capacity`` values"""
+        if not self._pending:
+            return
+        combined = pd.concat([self._table] + self._pending, ignore_index=True)
+        table = combined.groupby(['partition', 'value'], sort=False)['count'].sum().reset_index()
+        table = table.sort_values(['partition', 'count'], ascending=[True, False], kind='stable')
+        rank = table.groupby('partition', sort=False).cumcount().to_numpy()
+        over = rank == self.capacity
+        if over.any():
+            # Misra-Gries: subtract the (capacity + 1)-th largest count from every count of the partition
+            thresholds = np.zeros(len(self._decrements), dtype=np.int64)
+            thresholds[table['partition'].to_numpy()[over]] = table['count'].to_numpy()[over]
+            self._decrements = self._decrements + thresholds
+            table['count'] = table['count'].to_numpy() - thresholds[table['partition'].to_numpy()]
+            table = table[table['count'] > 0]
+        self._table = table.reset_index(drop=True)
+        self._pending = []
+        self._pending_rows = 0
+
+    def _selected(self, bits, year_range, rating_range):
+        """Which partitions are on any platform in ``bits`` inside the slider ranges"""
+        low, high = bucket_range(rating_range)
+        years = self._keys['year']
+        buckets = self._keys['bucket']
+        return (
+            ((self._keys['mask'] & np.uint64(bits)) != 0) &
+            (years >= year_range[0]) & (years <= year_range[1]) &
+            (buckets >= low) & (buckets <= high)
+        )
+
+    @property
+    def table(self):
+        """The summaries as a ``Tally`` table, (mask, year, bucket, value, count)"""
+        self.compact()
+        partitions = self._table['partition'].to_numpy()
+        return pd.DataFrame({
+            **{key: self._keys[key][partitions] for key in self.PARTITION_KEYS},
+            'value': self._table['value'].to_numpy(),
+            'count': self._table['count'].to_numpy(),
+        })
+
+    def select(self, bits, year_range, rating_range):
+        """Summary entries on any platform in ``bits`` inside the slider ranges"""
+        table = self.table
+        keep = self._selected(bits, year_range, rating_range)[self._table['partition'].to_numpy()]
+        return table[keep]
+
+    def counts(self, bits, year_range, rating_range):
+        """Counts per value, ranked by ``rank_counts``; each at most ``undercount(...)`` below the true count"""
+        self.compact()
+        keep = self._selected(bits, year_range, rating_range)[self._table['partition'].to_numpy()]
+        counts = self._table[keep].groupby('value', sort=False)['count'].sum()
+        return rank_counts(counts)
+
+    def undercount(self, bits, year_range, rating_range):
+        """Largest amount by which a count of ``counts(...)`` falls short, a value missing from it included"""
+        self.compact()
+        return int(self._decrements[self._selected(bits, year_range, rating_range)].sum())
+
+    def distinct(self, bits, year_range, rating_range):
+        """Estimated number of distinct values, within ``relative_error`` most of the time"""
+        selected = self._selected(bits, year_range, rating_range)
+        if not selected.any():
+            return 0
+        return int(round(hll_estimate(self._registers[selected].max(axis=0))))
+
+    def nbytes(self):
+        """Bytes held by the registers, decrements and summary table"""
+        self.compact()
+        return (self._registers.nbytes + self._decrements.nbytes + sum(keys.nbytes for keys in self._keys.values())
+                + int(self._table.memory_usage(index=False, deep=True).sum()))
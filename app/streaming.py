@@ -0,0 +1,161 @@
+# Streaming ingestion into chart-ready summaries
+#
+# For catalogs that do not fit in memory the CSV is read in chunks through a
+# generator pipeline (read -> prepare -> aggregate).  Each chunk is parsed,
+# its countries exploded, folded into the summaries and then dropped, so
+# memory is bounded by the size of the summaries plus one chunk.
+import os
+import resource
+
+import numpy as np
+import pandas as pd
+
+from cube import DataCube, Tally
+from data import DATA_PATH, PLATFORMS, encode_platforms, parse_json_column
+from indexes import split_genres
+from sketches import SketchTally
+
+DEFAULT_MEMORY_LIMIT_MB = 1024
+MIN_CHUNK_ROWS = 1_000
+MAX_CHUNK_ROWS = 1_000_000
+
+# Parsed chunks take several times their raw frame size while being exploded
+# and grouped, and freed chunks are not always returned to the OS, so each
+# chunk is sized to use only part of the headroom left under the limit
+CHUNK_EXPANSION = 4
+HEADROOM_FRACTION = 0.5
+
+VOTE_BINS_PER_DECADE = 5
+
+# CSV columns the summaries are built from, besides one column per platform
+SUMMARY_COLUMNS = ['Year', 'genres', 'production_countries', 'release_date', 'vote_average', 'vote_count']
+
+
+def vote_bins(votes):
+    """Logarithmic vote count bins, ``VOTE_BINS_PER_DECADE`` per power of ten"""
+    return np.floor(np.log10(1 + np.asarray(votes, dtype=np.float64)) * VOTE_BINS_PER_DECADE).astype(np.int64)
+
+
+def vote_bin_edges(vote_bin):
+    """Smallest and largest vote count falling into ``vote_bin``"""
+    low = int(np.ceil(10 ** (vote_bin / VOTE_BINS_PER_DECADE) - 1))
+    high = int(np.ceil(10 ** ((vote_bin + 1) / VOTE_BINS_PER_DECADE) - 1)) - 1
+    return low, max(low, high)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # No procfs, fall back to the peak which is an upper bound
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def iter_chunks(path, platforms, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, chunk_rows=None):
+    """Yield raw CSV chunks sized to stay under ``memory_limit_mb`` of RSS
+
+    Unless ``chunk_rows`` fixes the size, the first chunk is small and later
+    ones are sized from the memory per row of the previous chunk (the larger
+    of its frame size estimate and the peak growth measured while it was
+    processed) and the headroom left under the limit.  Raises ``MemoryError``
+    when the process is already over the limit.
+    """
+    reader = pd.read_csv(path, usecols=SUMMARY_COLUMNS + list(platforms), iterator=True)
+    size = chunk_rows or MIN_CHUNK_ROWS
+    with reader:
+        while True:
+            rss = current_rss_mb()
+            if rss >= memory_limit_mb:
+                raise MemoryError(f"Streaming ingest is using {rss:.0f} MB, over its {memory_limit_mb} MB limit")
+            try:
+                chunk = reader.get_chunk(size)
+            except StopIteration:
+                return
+            yield chunk
+            if chunk_rows is None:
+                # The caller has processed the chunk by the time the generator resumes
+                estimate = chunk.memory_usage(deep=True).sum() / 2 ** 20 * CHUNK_EXPANSION
+                row_mb = max(estimate, peak_rss_mb() - rss) / len(chunk)
+                headroom = (memory_limit_mb - current_rss_mb()) * HEADROOM_FRACTION
+                size = int(np.clip(headroom / row_mb, MIN_CHUNK_ROWS, MAX_CHUNK_ROWS))
+
+
+def prepare_chunks(chunks, platforms):
+    """Parse raw chunks into the columns the summaries aggregate"""
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        chunk['platform_mask'] = encode_platforms(chunk, platforms)
+        chunk['release_month'] = pd.to_datetime(chunk['release_date'], errors='coerce').dt.month
+        lengths, _, countries = parse_json_column(chunk['production_countries'], 'iso_3166_1')
+        rows = np.repeat(np.arange(len(chunk)), lengths)
+        yield chunk.drop(columns=['production_countries', 'release_date']), rows, countries
+
+
+class StreamingSummaries:
+    """Everything the dashboard charts need, aggregated without keeping any title rows
+
+    ``cube`` answers the time-series, seasonal, platform and metric queries,
+    while the tallies hold per-country, per-genre and per-vote-bin counts.
+    With ``approximate`` the country and genre tallies are ``SketchTally``
+    sketches, bounded in size however many titles are added.
+    """
+
+    def __init__(self, platforms, approximate=False):
+        self.platforms = list(platforms)
+        self.approximate = approximate
+        self.cube = DataCube(platforms)
+        self.countries = SketchTally() if approximate else Tally()
+        self.genres = SketchTally() if approximate else Tally()
+        self.vote_bins = Tally()
+        self.titles = 0
+
+    def add(self, chunk, country_rows, countries):
+        masks = chunk['platform_mask'].to_numpy()
+        years = chunk['Year'].to_numpy()
+        ratings = chunk['vote_average'].to_numpy()
+        self.cube.add(chunk)
+        genre_lengths, genres = split_genres(chunk['genres'].to_numpy())
+        genre_rows = np.repeat(np.arange(len(chunk)), genre_lengths)
+        self.genres.add(masks[genre_rows], years[genre_rows], ratings[genre_rows], np.asarray(genres, dtype=object))
+        self.vote_bins.add(masks, years, ratings, vote_bins(chunk['vote_count'].fillna(0)))
+        self.countries.add(masks[country_rows], years[country_rows], ratings[country_rows],
+                           np.asarray(countries, dtype=object))
+        self.titles += len(chunk)
+
+    @classmethod
+    def from_frames(cls, df, countries_df, platforms):
+        """Summaries of titles already loaded by ``load_data``"""
+        summaries = cls(platforms)
+        summaries.add(df, countries_df['row'].to_numpy(), countries_df['country'].to_numpy())
+        summaries.compact()
+        return summaries
+
+    def copy(self):
+        summaries = StreamingSummaries(self.platforms, self.approximate)
+        summaries.cube = self.cube.copy()
+        summaries.countries = self.countries.copy()
+        summaries.genres = self.genres.copy()
+        summaries.vote_bins = self.vote_bins.copy()
+        summaries.titles = self.titles
+        return summaries
+
+    def compact(self):
+        for tally in (self.countries, self.genres, self.vote_bins):
+            tally.compact()
+
+
+def ingest(path=DATA_PATH, platforms=PLATFORMS, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, chunk_rows=None,
+           approximate=False):
+    """Stream ``path`` into ``StreamingSummaries`` while keeping RSS under ``memory_limit_mb``"""
+    summaries = StreamingSummaries(platforms, approximate)
+    for chunk, country_rows, countries in prepare_chunks(iter_chunks(path, platforms, memory_limit_mb, chunk_rows),
+                                                         platforms):
+        summaries.add(chunk, country_rows, countries)
+    summaries.compact()
+    return summaries
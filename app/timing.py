@@ -0,0 +1,201 @@
+# Per-callback stage timing
+#
+# With timing on, every dashboard callback records how long it spent in each
+# stage: filtering the titles, aggregating them, serializing the figure, and
+# building it (everything else).  Stages are marked where the work happens
+# (filters.py, queries.py, cube.py, figure_cache.py) and time spent in a
+# nested stage counts only towards the inner one.  Latencies go into
+# fixed-bucket histograms per (callback, stage), reported by ``/metrics``.
+#
+# With timing off nothing is wrapped: the stage markers find no record for
+# the current thread and return straight away.
+import contextlib
+import functools
+import threading
+import time
+
+STAGES = ('filter', 'aggregate', 'build', 'serialize')
+
+# Upper bounds in seconds, as Prometheus client libraries default to
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+_NO_STAGE = contextlib.nullcontext()
+
+
+class Histogram:
+    """Observation counts per bucket and their sum, reported cumulatively like Prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, ending with ``+Inf``"""
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            yield bound, running
+
+
+class _Record:
+    """Stage times of one callback run on the current thread"""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.rows = 0
+        # [stage, start, time spent in nested stages]
+        self._stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        entry = [name, time.perf_counter(), 0.0]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - entry[1]
+            self.seconds[name] += elapsed - entry[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+
+def stage(name):
+    """Context manager timing a stage of the running callback, a no-op when not timing"""
+    record = getattr(_local, 'record', None)
+    return _NO_STAGE if record is None else record.stage(name)
+
+
+def timed(name):
+    """Decorator timing every call of the function as stage ``name``"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            record = getattr(_local, 'record', None)
+            if record is None:
+                return function(*args, **kwargs)
+            with record.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_rows(count):
+    """Count ``count`` rows towards the running callback"""
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record.rows += count
+
+
+class CallbackTimings:
+    """Latency histograms per callback and stage, and the rows each callback selected"""
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        # callback -> stage or 'total' -> Histogram
+        self.histograms = {}
+        # callback -> rows selected by all its calls
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def callback(self, name):
+        """Decorator timing a callback under ``name``, returns it unchanged when disabled"""
+        def decorator(callback):
+            if not self.enabled:
+                return callback
+
+            @functools.wraps(callback)
+            def wrapper(*args, **kwargs):
+                outer = getattr(_local, 'record', None)
+                record = _local.record = _Record()
+                start = time.perf_counter()
+                try:
+                    return callback(*args, **kwargs)
+                finally:
+                    total = time.perf_counter() - start
+                    _local.record = outer
+                    self._observe(name, record, total)
+            return wrapper
+        return decorator
+
+    def _observe(self, name, record, total):
+        # Whatever no stage claimed is building the figure or component tree
+        record.seconds['build'] += total - sum(record.seconds.values())
+        with self._lock:
+            histograms = self.histograms.get(name)
+            if histograms is None:
+                histograms = self.histograms[name] = {
+                    key: Histogram(self.buckets) for key in STAGES + ('total',)
+                }
+            for key, seconds in record.seconds.items():
+                histograms[key].observe(seconds)
+            histograms['total'].observe(total)
+            self.rows[name] = self.rows.get(name, 0) + record.rows
+
+    def stats(self):
+        """Calls, mean seconds per stage and rows per callback"""
+        with self._lock:
+            return {
+                name: {
+                    'calls': histograms['total'].count,
+                    'mean_seconds': {key: histogram.sum / histogram.count
+                                     for key, histogram in histograms.items()},
+                    'rows': self.rows[name],
+                }
+                for name, histograms in self.histograms.items()
+            }
+
+    def prometheus_lines(self):
+        """The histograms and row counters in the Prometheus text exposition format"""
+        lines = [
+            '# HELP dashboard_callback_seconds Time spent per callback call, by stage',
+            '# TYPE dashboard_callback_seconds histogram',
+        ]
+        with self._lock:
+            for name, histograms in self.histograms.items():
+                for key, histogram in histograms.items():
+                    labels = f'callback="{name}",stage="{key}"'
+                    for bound, count in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'dashboard_callback_seconds_bucket{{{labels},le="{le}"}} {count}')
+                    lines.append(f'dashboard_callback_seconds_sum{{{labels}}} {histogram.sum!r}')
+                    lines.append(f'dashboard_callback_seconds_count{{{labels}}} {histogram.count}')
+            lines += [
+                '# HELP dashboard_callback_rows_total Rows selected by the queries of each callback',
+                '# TYPE dashboard_callback_rows_total counter',
+            ]
+            lines += [f'dashboard_callback_rows_total{{callback="{name}"}} {rows}' for name, rows in self.rows.items()]
+        return lines
+
+
+def cache_lines(caches):
+    """``LRUCache.stats()`` of named caches in the Prometheus text exposition format"""
+    metrics = [
+        ('hits', 'counter', 'Cache lookups answered from the cache'),
+        ('misses', 'counter', 'Cache lookups that had to compute'),
+        ('evictions', 'counter', 'Entries dropped to stay under maxsize'),
+        ('coalesced', 'counter', 'Cache misses that waited for the same key being computed'),
+        ('size', 'gauge', 'Entries currently cached'),
+    ]
+    lines = []
+    for key, kind, description in metrics:
+        name = f'dashboard_cache_{key}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{{cache="{cache}"}} {stats[key]}' for cache, stats in caches.items() if stats is not None]
+    return lines
@@ -0,0 +1,171 @@
+# Warming the figure cache at startup
+#
+# The first request for a filter state pays for filtering, aggregating and
+# building every chart.  At startup a small thread pool builds the charts for
+# the states users are likely to ask for first, most likely first:
+#
+#   the default layout state (every platform, both sliders at full range)
+#   the states requested most often recently, read from the access log
+#   each platform alone, and every platform over each decade of the
+#   year-slider marks, plus any states listed in DASHBOARD_WARM_STATES
+#
+# The server takes requests meanwhile.  A request for a state being warmed
+# waits for that build rather than starting another (see LRUCache).
+#
+# The access log is a file of requested filter states, one JSON line each,
+# appended to by every worker process and trimmed to its most recent
+# entries when a process starts.
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_POPULAR_STATES = 20
+DECADE = 10
+# Lines of the access log kept, and seconds in which a repeated state is logged once
+ACCESS_LOG_ENTRIES = 10_000
+RECORD_WINDOW = 5.0
+
+
+def common_states(platforms, year_bounds, rating_bounds=(0, 10)):
+    """The default layout state, each platform alone, and every platform over each decade of the year slider"""
+    min_year, max_year = (int(year) for year in year_bounds)
+    full_years = [min_year, max_year]
+    full_ratings = [float(rating) for rating in rating_bounds]
+    states = [(list(platforms), full_years, full_ratings)]
+    states += [([platform], full_years, full_ratings) for platform in platforms]
+    # The year-slider marks every 5 years from min_year; decades run mark to mark
+    states += [
+        (list(platforms), [start, min(start + DECADE, max_year)], full_ratings)
+        for start in range(min_year, max_year, DECADE)
+    ]
+    return states
+
+
+def read_states(path):
+    """Filter states listed in a JSON file as ``[platforms, year_range, rating_range]`` triples"""
+    with open(path) as f:
+        return [tuple(state) for state in json.load(f)]
+
+
+class AccessLog:
+    """Filter states requested from the dashboard, shared by every process through one file"""
+
+    def __init__(self, path, window=RECORD_WINDOW, max_entries=ACCESS_LOG_ENTRIES):
+        self.path = path
+        self.window = window
+        self.max_entries = max_entries
+        # state -> when this process last logged it
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def record(self, state):
+        """Log a normalized filter state, once per ``window`` seconds
+
+        Every chart of the dashboard requests the same state at once, so the
+        window keeps one interaction to one line.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._recent.get(state, -self.window) < self.window:
+                return
+            self._recent[state] = now
+            if len(self._recent) > 1024:
+                self._recent = {key: seen for key, seen in self._recent.items() if now - seen < self.window}
+        line = json.dumps([list(state[0]), [int(year) for year in state[1]], list(state[2])]) + '\n'
+        try:
+            with open(self.path, 'a') as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning("Cannot write access log %s: %s", self.path, e)
+
+    def popular(self, count=DEFAULT_POPULAR_STATES):
+        """The ``count`` states logged most often, trimming the log to its latest entries"""
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        if len(lines) > self.max_entries:
+            lines = lines[-self.max_entries:]
+            with open(self.path + '.tmp', 'w') as f:
+                f.writelines(lines)
+            os.replace(self.path + '.tmp', self.path)
+
+        counts = Counter()
+        for line in lines:
+            try:
+                platforms, year_range, rating_range = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            counts[(tuple(platforms), tuple(year_range), tuple(rating_range))] += 1
+        return [(list(platforms), list(year_range), list(rating_range))
+                for (platforms, year_range, rating_range), _ in counts.most_common(count)]
+
+
+class CacheWarmer:
+    """Builds every cached chart for a list of filter states on a background thread pool"""
+
+    def __init__(self, figures, states, workers=DEFAULT_WORKERS):
+        self.figures = figures
+        self.states = states
+        self.workers = workers
+        self.built = 0
+        self.failed = 0
+        self.seconds = None
+        self._executor = None
+        self._pending = 0
+        self._started = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Submit one build per (state, chart), states in the order given, and return at once"""
+        # The same state may come from several sources; build it once
+        states, seen = [], set()
+        for state in self.states:
+            key = self.figures.normalize(*state)
+            if key not in seen:
+                seen.add(key)
+                states.append(key)
+
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='cache-warmer')
+        self._started = time.perf_counter()
+        tasks = [(chart, state) for state in states for chart in self.figures.callbacks]
+        self._pending = len(tasks)
+        for chart, state in tasks:
+            self._executor.submit(self._warm, chart, state)
+        self._executor.shutdown(wait=False)
+        logger.info("Warming %d charts for %d filter states", len(tasks), len(states))
+        return self
+
+    def stop(self):
+        """Drop the builds not started yet and wait for the running ones"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _warm(self, chart, state):
+        try:
+            self.figures.warm(chart, *state)
+        except Exception:
+            logger.exception("Warming %s for %s failed", chart, state)
+            failed = True
+        else:
+            failed = False
+        with self._lock:
+            self.failed += failed
+            self.built += not failed
+            self._pending -= 1
+            if self._pending == 0:
+                self.seconds = time.perf_counter() - self._started
+                logger.info("Warmed the figure cache in %.1f s", self.seconds)
+
+    def stats(self):
+        with self._lock:
+            return {'built': self.built, 'failed': self.failed, 'pending': self._pending, 'seconds': self.seconds}
@@ -0,0 +1,64 @@
+# Benchmark: appending a batch of new titles vs reloading the whole catalog
+#
+# Builds a synthetic catalog by replicating the cleaned dataset, then times
+# Catalog.append for batches of different sizes against a cold load_data of
+# the catalog with the batch included (what a restart used to cost).
+#
+#   python benchmarks/bench_append.py [--scale 100] [--batches 100 1000 10000]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from catalog import Catalog
+from data import DATA_PATH, PLATFORMS, load_data
+from queries import FrameQueries
+
+# Filter states already cached when the batch arrives
+STATES = [
+    (PLATFORMS, (2000, 2025), (0, 10)),
+    (['Netflix'], (2010, 2020), (5, 8)),
+    (['Hulu', 'Disney+'], (1990, 2024), (6.5, 9)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--batches', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    source = pd.read_csv(DATA_PATH)
+    catalog_rows = pd.concat([source] * args.scale, ignore_index=True)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'movies.csv')
+        catalog_rows.to_csv(path, index=False)
+        df, countries_df, indexes = load_data(path, cache_dir=None)
+        queries = FrameQueries(df, countries_df, PLATFORMS, indexes)
+        for state in STATES:
+            queries.title_stats(*state)
+
+        print(f"{len(df):,} titles")
+        print(f"{'batch':>8} {'append s':>9} {'reload s':>9}")
+        for size in args.batches:
+            batch = catalog_rows.sample(size, replace=True, random_state=0)
+            catalog = Catalog(queries)
+            start = time.perf_counter()
+            catalog.append(batch)
+            append_seconds = time.perf_counter() - start
+
+            pd.concat([catalog_rows, batch], ignore_index=True).to_csv(path, index=False)
+            start = time.perf_counter()
+            df, countries_df, indexes = load_data(path, cache_dir=None)
+            FrameQueries(df, countries_df, PLATFORMS, indexes)
+            reload_seconds = time.perf_counter() - start
+            print(f"{size:>8,} {append_seconds:>9.3f} {reload_seconds:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
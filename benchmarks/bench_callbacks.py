@@ -0,0 +1,93 @@
+# Benchmark: one slider move served by eight callbacks vs one combined callback
+#
+# Registers the dashboard callbacks on a synthetic catalog both ways and
+# replays the same sequence of filter states through Dash's update endpoint,
+# the way the browser does: eight requests per state with separate
+# callbacks, one with the combined callback.  The figure cache is disabled
+# so every request computes.
+#
+#   python benchmarks/bench_callbacks.py [--scale 10] [--states 50]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from dash import Dash, html
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from callbacks import register_callbacks
+from catalog import Catalog
+from data import DATA_PATH, PLATFORMS, load_data
+from figure_cache import FigureCache
+from queries import FrameQueries
+
+CONTROLS = ['platform-selector', 'year-slider', 'rating-slider']
+
+
+def random_states(n, seed=0):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(n):
+        platforms = [platform for platform in PLATFORMS if rng.random() < 0.6] or PLATFORMS[:1]
+        start = rng.randint(2000, 2020)
+        low = rng.randint(0, 16) / 2
+        states.append((platforms, [start, rng.randint(start, 2021)], [low, rng.randint(int(low * 2), 20) / 2]))
+    return states
+
+
+def make_client(queries, combined):
+    app = Dash(__name__)
+    app.layout = html.Div()
+    catalog = Catalog(queries)
+    register_callbacks(app, catalog, FigureCache(catalog, PLATFORMS, (2000, 2021), maxsize=0), combined=combined)
+    return app, app.server.test_client()
+
+
+def replay(app, client, states):
+    start = time.perf_counter()
+    requests = 0
+    for state in states:
+        inputs = [{'id': control, 'property': 'value', 'value': value} for control, value in zip(CONTROLS, state)]
+        for key in app.callback_map:
+            outputs = [
+                {'id': output.split('.')[0], 'property': output.split('.')[1]}
+                for output in key.strip('.').split('...')
+            ]
+            response = client.post('/_dash-update-component', json={
+                'output': key,
+                'outputs': outputs if key.startswith('..') else outputs[0],
+                'inputs': inputs,
+                'changedPropIds': ['year-slider.value'],
+            })
+            assert response.status_code == 200, response.data[:200]
+            requests += 1
+    return time.perf_counter() - start, requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--states', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'movies.csv')
+        pd.concat([pd.read_csv(DATA_PATH)] * args.scale, ignore_index=True).to_csv(path, index=False)
+        df, countries_df, indexes = load_data(path, cache_dir=None)
+
+    states = random_states(args.states)
+    print(f"{len(df):,} titles, {len(states)} filter states")
+    print(f"{'callbacks':>10} {'requests':>9} {'ms/state':>9}")
+    for combined in (False, True):
+        # A fresh engine each time, so neither run starts with cached filter results
+        app, client = make_client(FrameQueries(df, countries_df, PLATFORMS, indexes), combined)
+        seconds, requests = replay(app, client, states)
+        print(f"{'combined' if combined else 'separate':>10} {requests:>9} {seconds / len(states) * 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
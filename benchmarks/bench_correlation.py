@@ -0,0 +1,71 @@
+# Benchmark: ratings-vs-votes chart payload, raw scatter vs adaptive density
+#
+# Replicates the cleaned dataset 1x, 10x and 100x and builds the correlation
+# chart for all platforms both ways: the old px.scatter of every filtered
+# title with a full-frame corr(), and the current callback, which switches
+# to a density heatmap past SCATTER_MAX_POINTS titles.  Reports build time
+# and the JSON payload size sent to the browser.
+#
+#   python benchmarks/bench_correlation.py [--scales 1 10 100]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import plotly.express as px
+from dash import Dash
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from callbacks import register_callbacks
+from catalog import Catalog
+from data import DATA_PATH, PLATFORMS, load_data
+from figure_cache import FigureCache
+from queries import FrameQueries
+
+STATE = (PLATFORMS, [1900, 2030], [0, 10])
+
+
+def legacy_chart(queries):
+    correlation_data = queries.rating_votes(*STATE)
+    correlation_data.corr()
+    return px.scatter(correlation_data, x='vote_average', y='vote_count', opacity=0.6).to_json()
+
+
+def adaptive_chart(queries):
+    app = Dash(__name__)
+    catalog = Catalog(queries)
+    # A cache without room, so every call builds the figure
+    register_callbacks(app, catalog, FigureCache(catalog, PLATFORMS, (1900, 2030), maxsize=0))
+    # Dash's wrapper expects a request context, call the function it wraps
+    return app.callback_map['correlation-chart.figure']['callback'].__wrapped__(*STATE)
+
+
+def timed(build, queries):
+    start = time.perf_counter()
+    figure = build(queries)
+    return time.perf_counter() - start, len(figure if isinstance(figure, str) else json.dumps(figure))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    source = pd.read_csv(DATA_PATH)
+    print(f"{'titles':>9} {'chart':>9} {'seconds':>8} {'payload KB':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            path = os.path.join(directory, f'movies_x{scale}.csv')
+            pd.concat([source] * scale, ignore_index=True).to_csv(path, index=False)
+            df, countries_df, indexes = load_data(path, cache_dir=None)
+            for name, build in (('scatter', legacy_chart), ('adaptive', adaptive_chart)):
+                seconds, size = timed(build, FrameQueries(df, countries_df, PLATFORMS, indexes))
+                print(f"{len(df):>9,} {name:>9} {seconds:>8.3f} {size / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
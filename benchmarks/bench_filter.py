@@ -0,0 +1,76 @@
+# Benchmark: indexed range filtering vs a full scan of the title frame
+#
+# Replicates the cleaned dataset into a synthetic catalog and times both
+# filters over slider states ranging from everything selected down to a
+# single year and rating step.
+#
+#   python benchmarks/bench_filter.py [--scale 100] [--repeat 20]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from data import DATA_PATH, PLATFORMS, prepare_titles
+from filters import indexed_rows
+from indexes import TitleIndexes, selection_bits
+
+STATES = [
+    ('all', PLATFORMS, (1900, 2021), (0, 10)),
+    ('streaming era', PLATFORMS, (2000, 2021), (0, 10)),
+    ('decade, good', PLATFORMS, (2010, 2019), (7, 10)),
+    ('one platform', ['Netflix'], (2010, 2019), (6, 8)),
+    ('one year', PLATFORMS, (2015, 2015), (0, 10)),
+    ('one year, one step', PLATFORMS, (2015, 2015), (7, 7.5)),
+]
+
+
+def filter_data(df, selected_platforms, year_range, rating_range, platforms):
+    """The titles matching the filter, comparing every row: the dashboard's filter before the indexes"""
+    if not selected_platforms:
+        return pd.DataFrame()
+
+    mask = (
+        ((df['platform_mask'] & selection_bits(platforms, selected_platforms)) != 0) &
+        (df['Year'] >= year_range[0]) & (df['Year'] <= year_range[1]) &
+        (df['vote_average'] >= rating_range[0]) & (df['vote_average'] <= rating_range[1])
+    )
+    return df[mask.to_numpy()]
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    source = pd.read_csv(DATA_PATH)
+    df = pd.concat([source] * args.scale, ignore_index=True)
+    df, _, incidences = prepare_titles(df, PLATFORMS)
+    indexes = TitleIndexes(df, PLATFORMS, incidences=incidences)
+
+    print(f"{len(df):,} titles")
+    print(f"{'state':>20} {'selectivity':>12} {'scan ms':>9} {'indexed ms':>11} {'speedup':>8}")
+    for name, selected, year_range, rating_range in STATES:
+        scan_s, scanned = timed(lambda: filter_data(df, selected, year_range, rating_range, PLATFORMS), args.repeat)
+        index_s, rows = timed(lambda: indexed_rows(indexes, selected, year_range, rating_range), args.repeat)
+        assert np.array_equal(scanned.index.to_numpy(), rows)
+        print(f"{name:>20} {len(rows) / len(df):>11.2%} {scan_s * 1e3:>9.2f} {index_s * 1e3:>11.2f} "
+              f"{scan_s / index_s:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Benchmark: columnar load_data vs the old iterrows country explosion
+#
+# Builds synthetic catalogs by replicating the cleaned dataset 1x, 10x and
+# 100x, then loads each one in a fresh subprocess so peak RSS is measured
+# per run: with the old loader, by parsing with load_data, and from a warm
+# binary cache.  Also reports the memory of the title and country frames,
+# the old loader's full CSV frame against the compact serving schema.
+#
+#   python benchmarks/bench_load.py [--scales 1 10 100]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from data import DATA_PATH, load_data
+
+
+def legacy_load_data(data_path):
+    """The loader as it was before the columnar rewrite"""
+    df = pd.read_csv(data_path)
+
+    def extract_country_names(countries_json):
+        try:
+            if pd.isna(countries_json) or countries_json == '[]':
+                return []
+            countries = json.loads(countries_json)
+            return [country['name'] for country in countries]
+        except:
+            return []
+
+    def extract_language_names(languages_json):
+        try:
+            if pd.isna(languages_json) or languages_json == '[]':
+                return []
+            languages = json.loads(languages_json)
+            return [lang['name'] for lang in languages]
+        except:
+            return []
+
+    df['country_names'] = df['production_countries'].apply(extract_country_names)
+    df['language_names'] = df['spoken_languages'].apply(extract_language_names)
+
+    countries_expanded = []
+    for idx, row in df.iterrows():
+        for country in row['country_names']:
+            new_row = row.copy()
+            new_row['country'] = country
+            countries_expanded.append(new_row)
+
+    countries_df = pd.DataFrame(countries_expanded)
+
+    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
+    df['release_month'] = df['release_date'].dt.month
+    df['release_year'] = df['release_date'].dt.year
+
+    return df, countries_df
+
+
+def catalog_cache_dir(path):
+    return os.path.join(os.path.dirname(path), 'cache')
+
+
+LOADERS = {
+    'legacy': legacy_load_data,
+    'columnar': lambda path: load_data(path, cache_dir=None),
+    'cached': lambda path: load_data(path, cache_dir=catalog_cache_dir(path)),
+}
+
+
+def make_catalog(scale, directory):
+    path = os.path.join(directory, f'movies_x{scale}.csv')
+    source = pd.read_csv(DATA_PATH)
+    pd.concat([source] * scale, ignore_index=True).to_csv(path, index=False)
+    return path
+
+
+def run_loader(name, path):
+    start = time.perf_counter()
+    df, countries_df = LOADERS[name](path)[:2]
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'seconds': elapsed,
+        'titles': len(df),
+        'country_rows': len(countries_df),
+        'titles_mb': df.memory_usage(deep=True).sum() / 1e6,
+        'countries_mb': countries_df.memory_usage(deep=True).sum() / 1e6,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--run', nargs=2, metavar=('LOADER', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_loader(*args.run)
+        return
+
+    print(f"{'scale':>6} {'loader':>9} {'titles':>9} {'seconds':>9} {'titles MB':>10} {'countries MB':>13} "
+          f"{'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            path = make_catalog(scale, directory)
+            load_data(path, cache_dir=catalog_cache_dir(path))  # warm the cache
+            for name in LOADERS:
+                out = subprocess.run([sys.executable, __file__, '--run', name, path],
+                                     check=True, capture_output=True, text=True).stdout
+                result = json.loads(out)
+                print(f"{scale:>5}x {name:>9} {result['titles']:>9,} {result['seconds']:>9.2f} "
+                      f"{result['titles_mb']:>10.1f} {result['countries_mb']:>13.1f} {result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Benchmark: decoding the JSON columns with 1..N worker processes
+#
+# Replicates the cleaned dataset into a synthetic catalog and decodes
+# production_countries and spoken_languages the old way (Series.apply with
+# json.loads per row) and with decode_json_columns on an increasing number
+# of workers.  Repeated country and language lists are decoded once per
+# chunk, so even one worker beats per-row parsing; further speedups need as
+# many free cores as workers.
+#
+#   python benchmarks/bench_parse.py [--scale 200] [--workers 1 2 4 8]
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from data import DATA_PATH, decode_json_columns
+
+
+def legacy_decode(df):
+    """Per-row decoding as the loader did before the bulk parser"""
+    def extract_names(value):
+        try:
+            if pd.isna(value) or value == '[]':
+                return []
+            return [entry['name'] for entry in json.loads(value)]
+        except:
+            return []
+
+    return df['production_countries'].apply(extract_names), df['spoken_languages'].apply(extract_names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    df = pd.concat([pd.read_csv(DATA_PATH)] * args.scale, ignore_index=True)
+    columns = [(df['production_countries'], 'iso_3166_1'), (df['spoken_languages'], 'iso_639_1')]
+    print(f"{len(df):,} titles, {os.cpu_count()} cores")
+
+    start = time.perf_counter()
+    legacy_decode(df)
+    legacy = time.perf_counter() - start
+    print(f"{'decoder':>10} {'seconds':>9} {'speedup':>8}")
+    print(f"{'apply':>10} {legacy:>9.2f} {1:>7.1f}x")
+    for workers in args.workers:
+        start = time.perf_counter()
+        countries, languages = decode_json_columns(columns, workers)
+        seconds = time.perf_counter() - start
+        print(f"{f'{workers} proc':>10} {seconds:>9.2f} {legacy / seconds:>7.1f}x")
+    print(f"{len(countries.names)} distinct countries, {len(languages.names)} distinct languages, "
+          f"{len(countries.codes) + len(languages.codes):,} entries")
+
+
+if __name__ == '__main__':
+    main()
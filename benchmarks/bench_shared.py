@@ -0,0 +1,103 @@
+# Benchmark: per-worker memory with private vs shared (memory-mapped) data
+#
+# Starts N concurrent worker processes that each load a synthetic catalog
+# the way a gunicorn worker does and reports their RSS and PSS (proportional
+# set size, which splits shared pages between the processes mapping them).
+# Linux only, since it reads /proc/self/smaps_rollup.
+#
+#   python benchmarks/bench_shared.py [--scale 100] [--workers 1 2 4 8]
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from data import DATA_PATH, load_data
+
+# Seconds to wait for every worker to load its catalog and report
+WORKER_TIMEOUT = 600
+
+
+def memory_mb():
+    with open('/proc/self/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if line.split(':', 1)[0] in ('Rss', 'Pss'))
+    return {name: int(value.split()[0]) / 1024 for name, value in fields.items()}
+
+
+def worker(path, cache_dir, shared, barrier, results):
+    df, countries_df, indexes = load_data(path, cache_dir=cache_dir, shared=shared)
+    # Touch every numeric column and index array, as serving requests would
+    for column in df.select_dtypes('number'):
+        df[column].sum()
+    for values in indexes.arrays().values():
+        # The arrays include the genre, country and language names, not summable
+        if values.dtype.kind in 'iuf':
+            values.sum()
+    barrier.wait()  # measure while every worker is alive
+    results.put(memory_mb())
+    barrier.wait()
+
+
+def measure(path, cache_dir, shared, n_workers):
+    barrier = multiprocessing.Barrier(n_workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(path, cache_dir, shared, barrier, results))
+        for _ in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        samples = []
+        deadline = time.monotonic() + WORKER_TIMEOUT
+        while len(samples) < n_workers:
+            try:
+                samples.append(results.get(timeout=1))
+            except queue.Empty:
+                # A worker that raised never reaches the barrier, and the others wait there for it
+                failed = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"A worker exited with code {failed[0]}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Workers did not report within {WORKER_TIMEOUT} s")
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    return (sum(sample['Rss'] for sample in samples) / n_workers,
+            sum(sample['Pss'] for sample in samples) / n_workers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'movies.csv')
+        source = pd.read_csv(DATA_PATH)
+        pd.concat([source] * args.scale, ignore_index=True).to_csv(path, index=False)
+        cache_dir = os.path.join(directory, 'cache')
+        load_data(path, cache_dir=cache_dir)  # warm the cache
+
+        print(f"{len(source) * args.scale:,} titles")
+        print(f"{'workers':>8} {'mode':>8} {'RSS/worker MB':>14} {'PSS/worker MB':>14}")
+        for n_workers in args.workers:
+            for shared in (False, True):
+                rss, pss = measure(path, cache_dir, shared, n_workers)
+                print(f"{n_workers:>8} {'shared' if shared else 'private':>8} {rss:>14.1f} {pss:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
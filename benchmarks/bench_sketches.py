@@ -0,0 +1,84 @@
+# Benchmark: exact country tally vs the approximate mode's sketches
+#
+# Replicates the cleaned dataset's (title, country) rows 1x, 10x and 100x.
+# Every replica names its countries apart ("France 3"), so the number of
+# distinct values grows with the catalog the way a wide dimension does.
+# Both tallies are filled from the same rows, then queried for a few filter
+# states: reports their size, the query time, the largest count error next
+# to the bound the sketch reports, and the error of the distinct count.
+#
+#   python benchmarks/bench_sketches.py [--scales 1 10 100]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from cube import Tally
+from data import PLATFORMS, load_data
+from sketches import SketchTally
+
+STATES = [
+    (0b1111, [1900, 2030], [0, 10]),
+    (0b0001, [2000, 2010], [5, 8]),
+    (0b0110, [2015, 2030], [6.5, 10]),
+]
+
+
+def country_rows(scale):
+    df, countries_df, _ = load_data(platforms=PLATFORMS)
+    rows = countries_df['row'].to_numpy()
+    countries = countries_df['country'].to_numpy().astype(str)
+    replicas = np.repeat(np.arange(scale), len(rows))
+    names = np.char.add(np.char.add(np.tile(countries, scale), ' '), replicas.astype(str)).astype(object)
+    rows = np.tile(rows, scale)
+    return (df['platform_mask'].to_numpy()[rows], df['Year'].to_numpy()[rows],
+            df['vote_average'].to_numpy()[rows], names)
+
+
+def fill(tally, columns, chunk_rows=100_000):
+    start = time.perf_counter()
+    for i in range(0, len(columns[0]), chunk_rows):
+        tally.add(*(column[i:i + chunk_rows] for column in columns))
+    tally.compact()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'tally':>7} {'build s':>8} {'MB':>7} {'query ms':>9} "
+          f"{'count err':>10} {'bound':>8} {'distinct err':>13}")
+    for scale in args.scales:
+        columns = country_rows(scale)
+        exact, sketch = Tally(), SketchTally()
+        exact_seconds, sketch_seconds = fill(exact, columns), fill(sketch, columns)
+        exact_mb = exact.table.memory_usage(index=False, deep=True).sum() / 2**20
+
+        for name, tally, seconds, mb in (('exact', exact, exact_seconds, exact_mb),
+                                         ('sketch', sketch, sketch_seconds, sketch.nbytes() / 2**20)):
+            start = time.perf_counter()
+            for state in STATES:
+                tally.counts(*state)
+                if tally is sketch:
+                    tally.distinct(*state)
+            query_ms = (time.perf_counter() - start) / len(STATES) * 1000
+            count_error = bound = distinct_error = 0
+            if tally is sketch:
+                for state in STATES:
+                    truth = exact.counts(*state)
+                    estimate = sketch.counts(*state).reindex(truth.index).fillna(0)
+                    count_error = max(count_error, int((truth - estimate).max()))
+                    bound = max(bound, sketch.undercount(*state))
+                    distinct_error = max(distinct_error, abs(sketch.distinct(*state) / len(truth) - 1))
+            print(f"{len(columns[0]):>10,} {name:>7} {seconds:>8.2f} {mb:>7.1f} {query_ms:>9.1f} "
+                  f"{count_error:>10,} {bound:>8,} {distinct_error:>12.1%}")
+
+
+if __name__ == '__main__':
+    main()
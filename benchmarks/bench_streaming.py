@@ -0,0 +1,70 @@
+# Benchmark: peak RSS of streaming ingestion against its memory ceiling
+#
+# Writes a synthetic catalog by appending the cleaned dataset --scale times,
+# then streams it into the chart summaries in a fresh subprocess and reports
+# the peak RSS.  Exits non-zero when the peak goes over --memory-limit-mb, so
+# it can also be run as a check.
+#
+#   python benchmarks/bench_streaming.py [--scale 200] [--memory-limit-mb 512]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from data import DATA_PATH
+from streaming import ingest, peak_rss_mb
+
+
+def make_catalog(scale, directory):
+    """Append the source ``scale`` times, one copy at a time, so the writer stays small too"""
+    path = os.path.join(directory, f'movies_x{scale}.csv')
+    source = pd.read_csv(DATA_PATH)
+    for i in range(scale):
+        source.to_csv(path, index=False, header=i == 0, mode='w' if i == 0 else 'a')
+    return path, len(source) * scale
+
+
+def run_ingest(path, memory_limit_mb):
+    start = time.perf_counter()
+    summaries = ingest(path, memory_limit_mb=memory_limit_mb)
+    print(json.dumps({
+        'seconds': time.perf_counter() - start,
+        'titles': summaries.titles,
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=200)
+    parser.add_argument('--memory-limit-mb', type=int, default=512)
+    parser.add_argument('--run', metavar='PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_ingest(args.run, args.memory_limit_mb)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path, titles = make_catalog(args.scale, directory)
+        csv_mb = os.path.getsize(path) / 2 ** 20
+        out = subprocess.run([sys.executable, __file__, '--run', path, '--memory-limit-mb', str(args.memory_limit_mb)],
+                             check=True, capture_output=True, text=True).stdout
+        result = json.loads(out)
+
+    print(f"{titles:,} titles, {csv_mb:.0f} MB of CSV")
+    print(f"ingested {result['titles']:,} titles in {result['seconds']:.1f}s, "
+          f"peak RSS {result['peak_rss_mb']:.1f} MB (limit {args.memory_limit_mb} MB)")
+    if result['peak_rss_mb'] > args.memory_limit_mb:
+        sys.exit(f"peak RSS over the {args.memory_limit_mb} MB limit")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# Benchmark: cost of the per-callback stage timing, and where callback time goes
+#
+# Replays the same filter states through the separate dashboard callbacks
+# with timing off and on, then prints the mean seconds per stage that the
+# timed run recorded for each chart.  The figure cache is disabled so every
+# request computes.
+#
+#   python benchmarks/bench_timing.py [--scale 10] [--states 50]
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+from dash import Dash, html
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from bench_callbacks import random_states, replay
+from callbacks import register_callbacks
+from catalog import Catalog
+from data import DATA_PATH, PLATFORMS, load_data
+from figure_cache import FigureCache
+from queries import FrameQueries
+from timing import STAGES, CallbackTimings
+
+
+def make_client(queries, timings):
+    app = Dash(__name__)
+    app.layout = html.Div()
+    catalog = Catalog(queries)
+    register_callbacks(app, catalog, FigureCache(catalog, PLATFORMS, (2000, 2021), maxsize=0), timings=timings)
+    return app, app.server.test_client()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--states', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'movies.csv')
+        pd.concat([pd.read_csv(DATA_PATH)] * args.scale, ignore_index=True).to_csv(path, index=False)
+        df, countries_df, indexes = load_data(path, cache_dir=None)
+
+    states = random_states(args.states)
+    print(f"{len(df):,} titles, {len(states)} filter states")
+    for enabled in (False, True):
+        timings = CallbackTimings(enabled=enabled)
+        app, client = make_client(FrameQueries(df, countries_df, PLATFORMS, indexes), timings)
+        seconds, _ = replay(app, client, states)
+        print(f"timing {'on ' if enabled else 'off'}: {seconds / len(states) * 1000:.1f} ms/state")
+
+    print(f"\n{'callback':>26} " + ' '.join(f'{stage:>9}' for stage in STAGES + ('total',)) + f" {'rows':>9}")
+    for name, stats in timings.stats().items():
+        means = ' '.join(f"{stats['mean_seconds'][stage] * 1000:>9.2f}" for stage in STAGES + ('total',))
+        print(f"{name:>26} {means} {stats['rows'] // stats['calls']:>9,}")
+
+
+if __name__ == '__main__':
+    main()